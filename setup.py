@@ -59,7 +59,8 @@ setup(
             "pillow>=3.0,<6.0; python_version < '3.5'",
             "pillow>=3.0,<8.0; python_version >= '3.5' and python_version < '3.6'",
             "pillow>=8.0; python_version >= '3.6'",
-        ]
+        ],
+        "JPype": ["JPype1>=1.2"],
     },
     install_requires=open('requirements.txt').readlines(),
     python_requires=">=3",
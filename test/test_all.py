@@ -1,5 +1,10 @@
+import asyncio
 import logging
 import os
+import pathlib
+import shutil
+import subprocess
+import sys
 from itertools import product
 from tempfile import mkdtemp
 
@@ -9,6 +14,7 @@ from nose2.tools.decorators import with_setup
 from nose2.tools.such import helper
 from nose2.tools import params
 import unittest
+from io import BytesIO
 
 import zxing
 
@@ -56,7 +62,9 @@ def _check_decoding(filename, expected_format, expected_raw, extra={}, as_Image=
         raise unittest.SkipTest("ZXing v{} CommandLineRunner is broken for combination of {} barcode format and --raw option".format(
             test_reader.zxing_version, expected_format))
     path = os.path.join(test_barcode_dir, filename)
-    what = Image.open(path) if as_Image else path
+    what = path
+    if as_Image:
+        what = Image.open(path) if as_Image is True else Image.open(path).convert(as_Image)
     logging.debug('Trying to parse {}, expecting {!r}.'.format(path, expected_raw))
     dec = test_reader.decode(what, pure_barcode=True, **extra)
     if expected_raw is None:
@@ -82,6 +90,189 @@ def test_decoding_from_Image():
     yield from ((_check_decoding, filename, expected_format, expected_raw, {}, True) for filename, expected_format, expected_raw in test_valid_images)
 
 
+@with_setup(setup_reader)
+def test_decoding_from_file_objects():
+    global test_reader
+    filename, expected_format, expected_raw = test_barcodes[0]
+    path = os.path.join(test_barcode_dir, filename)
+    with open(path, 'rb') as fobj:
+        dec = test_reader.decode(fobj, pure_barcode=True)
+        assert dec.raw == expected_raw
+        assert os.path.samefile(dec.path, path), (
+            'Expected {!r} to be read directly, but got {!r}'.format(path, dec.path))
+    with open(path, 'rb') as fobj:
+        dec = test_reader.decode(BytesIO(fobj.read()), pure_barcode=True)
+        assert dec.raw == expected_raw
+        assert not os.path.exists(dec.path), (
+            'Expected temporary file {!r} to be deleted, but it still exists'.format(dec.path))
+
+
+def test_decoding_from_Image_with_alpha():
+    yield from ((_check_decoding, filename, expected_format, expected_raw, {}, mode)
+                for filename, expected_format, expected_raw in test_valid_images for mode in ('LA', 'RGBA'))
+
+
+@with_setup(setup_reader)
+def test_decoding_from_numpy_arrays():
+    global test_reader
+    try:
+        import numpy as np
+    except ImportError:
+        raise unittest.SkipTest("NumPy not installed")
+    filename, expected_format, expected_raw = test_barcodes[0]
+    with Image.open(os.path.join(test_barcode_dir, filename)) as im:
+        rgb, gray = np.asarray(im.convert('RGB')), np.asarray(im.convert('L'))
+    rgba = np.dstack([rgb, np.full(rgb.shape[:2], 255, np.uint8)])
+
+    for a in (gray, gray[:, 1:], gray[::2, ::2], rgb, rgba, gray[:, :, None]):
+        dec = test_reader.decode(a, pure_barcode=True)
+        assert dec.raw == expected_raw, 'Failed with array of shape {!r}'.format(a.shape)
+        assert not os.path.exists(dec.path)
+    dec = zxing.BarCodeReader(channel_order='BGR').decode(np.ascontiguousarray(rgb[:, :, ::-1]))
+    assert dec.raw == expected_raw
+
+    # A stack of frames is a batch
+    decs = test_reader.decode(np.stack([gray, np.full_like(gray, 255), gray]))
+    assert [dec.raw for dec in decs] == [expected_raw, None, expected_raw]
+    with helper.assertRaises(ValueError):
+        test_reader.decode(gray.astype(np.float32))
+
+
+@with_setup(setup_reader)
+def test_decode_frames():
+    global test_reader
+    blank = Image.new('L', (200, 200), 255)
+    with Image.open(os.path.join(test_barcode_dir, 'QR_CODE-easy.png')) as im:
+        qr = im.convert('L').resize((200, 200))
+    with Image.open(os.path.join(test_barcode_dir, 'AZTEC-easy.jpg')) as im:
+        aztec = im.convert('L').resize((200, 200))
+    path = os.path.join(mkdtemp(), 'frames.tiff')
+    blank.save(path, save_all=True, append_images=[blank, qr, qr, blank, aztec])
+
+    found = [(index, dec.raw) for index, dec in test_reader.decode_frames(path, stop_on_first=False)]
+    assert found == [(2, 'This should be QR_CODE'), (5, 'This should be AZTEC')]
+    assert test_reader.last_stats.images == 4, 'Expected duplicate frames to be skipped'
+    found = [(index, dec.raw) for index, dec in test_reader.decode_frames(path, batch_size=2)]
+    assert found == [(2, 'This should be QR_CODE')]
+    found = [index for index, dec in test_reader.decode_frames(path, every_nth=2, dedupe=False, stop_on_first=False)]
+    assert found == [2]
+
+
+@with_setup(setup_reader)
+def test_adaptive_decoding():
+    global test_reader
+    with Image.open(os.path.join(test_barcode_dir, 'QR_CODE-easy.png')) as im:
+        inverted = im.convert('L').point(lambda v: 255 - v)
+    with Image.open(os.path.join(test_barcode_dir, 'CODE_128-easy.jpg')) as im:
+        rotated = im.convert('L').rotate(-90, expand=True)
+    expected = test_reader.decode(rotated, try_harder=True)
+
+    easy, inv, empty = test_reader.decode([os.path.join(test_barcode_dir, 'QR_CODE-easy.png'), inverted,
+                                           os.path.join(test_barcode_dir, 'empty.png')], strategy='adaptive')
+    assert easy.raw == inv.raw == 'This should be QR_CODE'
+    assert (easy.decode_pass, inv.decode_pass) == ('fast', 'inverted')
+    assert easy.points == inv.points
+    assert not empty and empty.decode_pass == 'inverted'
+    assert empty.path == os.path.join(test_barcode_dir, 'empty.png')
+
+    dec = test_reader.decode(rotated, strategy=[('qr', dict(possible_formats=['QR_CODE'])), ('rotated', dict(preprocess='rotate90'))])
+    assert dec.raw == expected.raw and dec.decode_pass == 'rotated'
+    assert all(abs(x - ex) <= 1 and abs(y - ey) <= 1 for (x, y), (ex, ey) in zip(dec.points, expected.points)), (
+        'Expected points {!r} but got {!r}'.format(expected.points, dec.points))
+
+
+@with_setup(setup_reader)
+def test_multi_decoding():
+    global test_reader
+    both = Image.new('RGB', (700, 300), 'white')
+    with Image.open(os.path.join(test_barcode_dir, 'QR_CODE-easy.png')) as im:
+        both.paste(im.convert('RGB'), (20, 20))
+    with Image.open(os.path.join(test_barcode_dir, 'CODE_128-easy.jpg')) as im:
+        both.paste(im.convert('RGB'), (50, 180))
+    path = os.path.join(mkdtemp(), 'both.png')
+    both.save(path)
+    empty = os.path.join(test_barcode_dir, 'empty.png')
+
+    decs = test_reader.decode(path, multi=True)
+    assert isinstance(decs, zxing.BarCodes) and decs.path == path
+    assert sorted((dec.format, dec.raw, dec.path) for dec in decs) == [
+        ('CODE_128', 'This should be CODE_128', path), ('QR_CODE', 'This should be QR_CODE', path)]
+    assert all(dec.points for dec in decs)
+    assert zxing.BarCodes.from_dict(decs.to_dict()).to_dict() == decs.to_dict()
+
+    # Several output blocks for one file must be grouped with that file, also when batched
+    for batch_size in (None, 1):
+        multi, none = test_reader.decode([path, empty], multi=True, batch_size=batch_size)
+        assert sorted(dec.format for dec in multi) == ['CODE_128', 'QR_CODE']
+        assert not none and none.path == empty
+
+    # The same file twice is decoded once, and each gets its own copy of the results
+    again, once, empty_again = test_reader.decode([path, path, empty], multi=True)
+    assert again is not once and len(again) == len(once) == 2
+    assert again.to_dict() == once.to_dict() and not empty_again
+    assert all(a is not b for a, b in zip(again, once))
+
+    only_qr = test_reader.decode(path, multi=True, possible_formats='QR_CODE')
+    assert [dec.format for dec in only_qr] == ['QR_CODE']
+
+    cache = zxing.ResultCache()
+    cached_reader = zxing.BarCodeReader(cache=cache)
+    first = cached_reader.decode(path, multi=True)
+    assert cached_reader.decode(path, multi=True).to_dict() == first.to_dict() and len(first) == 2
+    assert cached_reader.decode(path).format in ('CODE_128', 'QR_CODE')
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    with helper.assertRaises(ValueError):
+        test_reader.decode(path, multi=True, strategy='adaptive')
+
+
+@with_setup(setup_reader)
+def test_decoding_with_roi():
+    global test_reader
+    with Image.open(os.path.join(test_barcode_dir, 'QR_CODE-easy.png')) as im:
+        qr = im.convert('L').resize((204, 204), Image.NEAREST)
+    big = Image.new('L', (2000, 1500), 255)
+    big.paste(qr, (1200, 600))
+    path = os.path.join(mkdtemp(), 'big.png')
+    big.save(path)
+
+    full = test_reader.decode(path)
+    assert full.raw == 'This should be QR_CODE'
+    roi = zxing.roi_from_barcode(full)
+    assert roi[0] < 1230 and roi[1] < 630 and roi[2] > 1374 and roi[3] > 774
+    for kwargs in (dict(roi=roi), dict(max_dimension=1000), dict(roi=[(0, 0, 100, 100), roi], max_dimension=300)):
+        dec = test_reader.decode(path, **kwargs)
+        assert dec.raw == full.raw, 'Failed with {!r}'.format(kwargs)
+        assert dec.path == path
+        # Points should be close to where they are in the full image
+        assert all(abs(x - fx) <= 4 and abs(y - fy) <= 4 for (x, y), (fx, fy) in zip(dec.points, full.points)), (
+            'Expected points {!r} but got {!r}'.format(full.points, dec.points))
+    assert not test_reader.decode([path, big], roi=(0, 0, 100, 100))[1]
+
+    # Same exception as without cropping or shrinking
+    missing = os.path.join(test_barcode_dir, 'nonexistent.png')
+    for kwargs in (dict(roi=roi), dict(max_dimension=1000)):
+        with helper.assertRaises(zxing.BarCodeReaderException) as cm:
+            test_reader.decode(missing, **kwargs)
+        assert cm.exception.filename == missing
+        assert isinstance(test_reader.decode(missing, errors='return', **kwargs), zxing.BarCodeReaderException)
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    else:
+        assert test_reader.decode(path, roi=tuple(np.array(roi))).raw == full.raw
+
+    # A region outside the image (e.g. when tracking a barcode which has left the frame) just finds nothing
+    outside = (2100, 1600, 2300, 1800)
+    inputs = [path, big] + ([] if np is None else [np.asarray(big)])
+    for dec in test_reader.decode(inputs, roi=outside):
+        assert not dec
+    decs = test_reader.decode(inputs, roi=[outside, roi])
+    assert [dec.raw for dec in decs] == [full.raw] * len(inputs)
+
+
 def test_possible_formats():
     yield from ((_check_decoding, filename, expected_format, expected_raw, dict(possible_formats=('CODE_93', expected_format, 'DATA_MATRIX')))
                 for filename, expected_format, expected_raw in test_barcodes)
@@ -100,6 +291,162 @@ def test_decoding_multiple():
             '{}: Expected {!r} but got {!r}'.format(filename, expected_format, dec.format))
 
 
+@with_setup(setup_reader)
+def test_decoding_in_batches():
+    global test_reader
+    _tvi = [x for x in test_valid_images if not ((3, 5, 0) <= test_reader.zxing_version_info < (3, 5, 3) and x[1] == 'PDF_417')]
+    filenames = [os.path.join(test_barcode_dir, filename) for filename, expected_format, expected_raw in _tvi]
+    uris = [pathlib.Path(fn).absolute().as_uri() for fn in filenames]
+    sizes = [len(b) for b in test_reader._batches(uris, 3, None, False, None, False, False)]
+    assert max(sizes) == 3 and sum(sizes) == len(uris)
+    assert all(len(b) == 1 for b in test_reader._batches(uris, None, 1, False, None, False, False))
+    for batching in (dict(batch_size=2), dict(max_cmdline_bytes=1)):
+        decs = test_reader.decode(filenames, pure_barcode=True, **batching)
+        assert len(decs) == len(_tvi)
+        for dec, (filename, expected_format, expected_raw) in zip(decs, _tvi):
+            assert dec.raw == expected_raw, (
+                '{}: Expected {!r} but got {!r}'.format(filename, expected_raw, dec.parsed))
+            assert dec.format == expected_format, (
+                '{}: Expected {!r} but got {!r}'.format(filename, expected_format, dec.format))
+
+
+@with_setup(setup_reader)
+def test_decoding_parallel():
+    global test_reader
+    _tvi = [x for x in test_valid_images if not ((3, 5, 0) <= test_reader.zxing_version_info < (3, 5, 3) and x[1] == 'PDF_417')]
+    filenames = [os.path.join(test_barcode_dir, filename) for filename, expected_format, expected_raw in _tvi]
+    decs = test_reader.decode_parallel(filenames, max_workers=3, pure_barcode=True)
+    assert len(decs) == len(_tvi)
+    for dec, (filename, expected_format, expected_raw) in zip(decs, _tvi):
+        assert dec.raw == expected_raw, (
+            '{}: Expected {!r} but got {!r}'.format(filename, expected_raw, dec.parsed))
+        assert dec.format == expected_format, (
+            '{}: Expected {!r} but got {!r}'.format(filename, expected_format, dec.format))
+
+
+@with_setup(setup_reader)
+def test_decoding_parallel_error():
+    global test_reader
+    filenames = [os.path.join(test_barcode_dir, filename) for filename, expected_format, expected_raw in test_valid_images]
+    with helper.assertRaises(zxing.BarCodeReaderException):
+        test_reader.decode_parallel(filenames + [os.path.join(test_barcode_dir, 'nonexistent.png')], max_workers=4, batch_size=1)
+
+
+@with_setup(setup_reader)
+def test_iter_decode():
+    global test_reader
+    _tvi = [x for x in test_valid_images if not ((3, 5, 0) <= test_reader.zxing_version_info < (3, 5, 3) and x[1] == 'PDF_417')]
+    filenames = [os.path.join(test_barcode_dir, filename) for filename, expected_format, expected_raw in _tvi]
+    expected = {pathlib.Path(fn).absolute().as_uri(): (expected_format, expected_raw)
+                for fn, (filename, expected_format, expected_raw) in zip(filenames, _tvi)}
+    decs = list(test_reader.iter_decode(filenames, pure_barcode=True))
+    assert sorted(dec.uri for dec in decs) == sorted(expected)
+    for dec in decs:
+        assert (dec.format, dec.raw) == expected[dec.uri], (
+            '{}: Expected {!r} but got {!r}'.format(dec.path, expected[dec.uri], (dec.format, dec.raw)))
+    decs = list(test_reader.iter_decode(filenames, pure_barcode=True, ordered=True, reorder_buffer=4))
+    assert [dec.uri for dec in decs] == list(expected)
+    with helper.assertRaises(zxing.BarCodeReaderException):
+        list(test_reader.iter_decode(filenames + [os.path.join(test_barcode_dir, 'nonexistent.png')]))
+
+
+def test_iter_decode_ordered_duplicates():
+    # Results which arrive out of order, for a batch with the same file more than once
+    filenames = [os.path.join(test_barcode_dir, fn) for fn in ('empty.png', 'QR_CODE-easy.png', 'QR_CODE-easy.png', 'empty.png')]
+
+    class ReversingReader(zxing.BarCodeReader):
+        def _iter_uris(self, file_uris, *args):
+            return reversed(list(super()._iter_uris(file_uris, *args)))
+
+    for cache in (None, zxing.ResultCache()):
+        decs = list(ReversingReader(cache=cache).iter_decode(filenames, ordered=True))
+        assert [dec.path for dec in decs] == filenames
+        assert [dec.raw for dec in decs] == [None, 'This should be QR_CODE', 'This should be QR_CODE', None]
+
+
+@with_setup(setup_reader)
+def test_decoding_async():
+    global test_reader
+    _tvi = [x for x in test_valid_images if not ((3, 5, 0) <= test_reader.zxing_version_info < (3, 5, 3) and x[1] == 'PDF_417')]
+    filenames = [os.path.join(test_barcode_dir, filename) for filename, expected_format, expected_raw in _tvi]
+
+    async def _decode_twice():
+        sem = asyncio.Semaphore(1)
+        return await asyncio.gather(test_reader.decode_async(filenames, pure_barcode=True, semaphore=sem),
+                                    test_reader.decode_async(Image.open(filenames[0]), pure_barcode=True, semaphore=sem))
+
+    decs, dec0 = asyncio.run(_decode_twice())
+    assert dec0.raw == _tvi[0][2]
+    for dec, (filename, expected_format, expected_raw) in zip(decs, _tvi):
+        assert dec.raw == expected_raw, (
+            '{}: Expected {!r} but got {!r}'.format(filename, expected_raw, dec.parsed))
+        assert dec.format == expected_format, (
+            '{}: Expected {!r} but got {!r}'.format(filename, expected_format, dec.format))
+
+
+@with_setup(setup_reader)
+def test_decoding_async_cancel():
+    global test_reader
+    filenames = [os.path.join(test_barcode_dir, filename) for filename, expected_format, expected_raw in test_valid_images]
+    procs = []
+
+    async def _spy(*args, **kwargs):
+        procs.append(await create_subprocess_exec(*args, **kwargs))
+        return procs[-1]
+
+    async def _decode_and_cancel():
+        task = asyncio.ensure_future(test_reader.decode_async(filenames, try_harder=True))
+        while not procs:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with helper.assertRaises(asyncio.CancelledError):
+            await task
+
+    create_subprocess_exec = asyncio.create_subprocess_exec
+    try:
+        asyncio.create_subprocess_exec = _spy
+        asyncio.run(_decode_and_cancel())
+    finally:
+        asyncio.create_subprocess_exec = create_subprocess_exec
+    assert procs[0].returncode is not None, 'Expected Java subprocess to be killed'
+
+
+def test_result_cache():
+    cache = zxing.ResultCache(maxsize=4)
+    cached_reader = zxing.BarCodeReader(cache=cache)
+    _tvi = [x for x in test_valid_images if x[1] != 'PDF_417']
+    filenames = [os.path.join(test_barcode_dir, filename) for filename, expected_format, expected_raw in _tvi]
+    first = cached_reader.decode(filenames[:4] + filenames[:2], pure_barcode=True)
+    assert (cache.hits, cache.misses, len(cache)) == (0, 6, 4)
+    assert [dec.uri for dec in first] == [pathlib.Path(fn).absolute().as_uri() for fn in filenames[:4] + filenames[:2]]
+    assert [dec.raw for dec in first[4:]] == [dec.raw for dec in first[:2]]
+
+    # Same images again, and via a copy (should be hits), plus one which isn't cached yet
+    copy = os.path.join(mkdtemp(), 'copy.png')
+    shutil.copyfile(filenames[0], copy)
+    second = cached_reader.decode([copy, filenames[3], filenames[4]], pure_barcode=True)
+    assert (cache.hits, cache.misses) == (2, 7)
+    assert second[0].path == copy and second[0].raw == first[0].raw
+    assert second[2].raw == _tvi[4][2]
+
+    # Different options aren't hits
+    cached_reader.decode(filenames[3])
+    assert (cache.hits, cache.misses) == (2, 8)
+
+
+def test_result_cache_persistent():
+    db = os.path.join(mkdtemp(), 'cache.sqlite')
+    filename, expected_format, expected_raw = test_barcodes[0]
+    empty = os.path.join(test_barcode_dir, test_non_barcodes[0][0])
+    decs = zxing.BarCodeReader(cache=zxing.ResultCache(path=db)).decode([os.path.join(test_barcode_dir, filename), empty])
+
+    cache = zxing.ResultCache(path=db)
+    again = zxing.BarCodeReader(java=os.devnull, cache=cache).decode([os.path.join(test_barcode_dir, filename), empty])
+    assert (cache.hits, cache.misses) == (2, 0)
+    assert [d.to_dict() for d in again] == [d.to_dict() for d in decs]
+    assert again[0].raw == expected_raw and not again[1]
+
+
 @params(*product((False, True), repeat=2))
 def test_parsing(with_raw_bits, with_netloc):
     stdout = ("""
@@ -130,6 +477,50 @@ Found 4 result points:
     assert r.startswith('BarCode(') and r.endswith(')')
 
 
+def test_parsing_negative_points():
+    stdout = """file:///tmp/aztec.png (format: AZTEC, type: TEXT):
+Raw result:
+A
+Parsed result:
+A
+Found 2 result points.
+  Point 0: (37.5,-0.5)
+  Point 1: (-0.5,-0.5)
+"""
+    dec = zxing.BarCode.parse(stdout.encode())
+    assert dec.points == [(37.5, -0.5), (-0.5, -0.5)]
+
+
+def test_parsing_multiple():
+    stdout = b"""file:///tmp/a.png (format: QR_CODE, type: TEXT):
+Raw result:
+line 1\r\rnot a Parsed result:\nline 3
+Parsed result:
+line 1
+Found 3 result points.
+  Point 0: (1.0,2.0)
+  Point 1: (3.0,4.0)
+  Point 2: (5.0,6.0)
+file:///tmp/b.png: No barcode found
+file:///tmp/c.png (format: CODE_128, type: TEXT):
+Raw result:
+Found 1 result point
+Parsed result:
+Found a barcode
+Raw bits:
+  cafe
+Found 2 result points.
+  Point 0: (7.0,8.0)
+  Point 1: (9.0,10.0)
+"""
+    a, b, c = zxing.BarCode.parse_all(stdout)
+    assert (a.uri, a.format, a.raw, a.parsed) == ('file:///tmp/a.png', 'QR_CODE', 'line 1\r\rnot a Parsed result:\nline 3', 'line 1')
+    assert a.points == [(1.0, 2.0), (3.0, 4.0), (5.0, 6.0)]
+    assert b.uri == 'file:///tmp/b.png' and not b
+    assert (c.raw, c.parsed, c.raw_bits) == ('Found 1 result point', 'Found a barcode', bytes.fromhex('cafe'))
+    assert c.points == [(7.0, 8.0), (9.0, 10.0)]
+
+
 def test_parsing_not_found():
     stdout = "file:///tmp/some%5ffile%5fwithout%5fbarcode.png: No barcode found\n"
     dec = zxing.BarCode.parse(stdout.encode())
@@ -146,12 +537,143 @@ def test_parsing_not_found():
     assert r.startswith('BarCode(') and r.endswith(')')
 
 
+@with_setup(setup_reader)
+def test_jpype_backend():
+    global test_reader
+    try:
+        import jpype  # noqa: F401
+    except ImportError:
+        raise unittest.SkipTest("JPype is not installed")
+    jpype_reader = zxing.BarCodeReader(backend='jpype')
+    filenames = [os.path.join(test_barcode_dir, filename) for filename, expected_format, expected_raw in test_valid_images]
+    for extra in ({}, dict(pure_barcode=True), dict(try_harder=True), dict(possible_formats=('QR_CODE', 'AZTEC'))):
+        for dec, expected in zip(jpype_reader.decode(filenames, **extra), test_reader.decode(filenames, **extra)):
+            assert (dec.uri, dec.format, dec.type, dec.raw, dec.parsed, dec.raw_bits, dec.points) == (
+                expected.uri, expected.format, expected.type, expected.raw, expected.parsed, expected.raw_bits, expected.points), (
+                'Expected {!r} but got {!r}'.format(expected, dec))
+    with helper.assertRaises(zxing.BarCodeReaderException):
+        jpype_reader.decode(os.path.join(test_barcode_dir, 'bad_format.png'))
+    for reader in (jpype_reader, test_reader):
+        with helper.assertRaises(zxing.BarCodeReaderException):
+            reader.decode(filenames[0], possible_formats='NOT_A_FORMAT')
+    # There's only one JVM, which can't switch to other JARs
+    with helper.assertRaises(zxing.BarCodeReaderException):
+        zxing.BarCodeReader(backend='jpype', jvm_options=['-Xmx64m']).decode(filenames[0])
+
+
+@with_setup(setup_reader)
+def test_worker_pool():
+    global test_reader
+    try:
+        import jpype  # noqa: F401
+    except ImportError:
+        raise unittest.SkipTest("JPype is not installed")
+    from zxing.worker import WorkerPool
+    filenames = [os.path.join(test_barcode_dir, filename) for filename, expected_format, expected_raw in test_valid_images]
+    with WorkerPool(test_reader, size=2, max_jobs=2) as pool:
+        for fn in filenames[:3]:
+            dec, expected = pool.decode(fn), test_reader.decode(fn)
+            assert isinstance(dec, zxing.BarCode) and dec.to_dict() == expected.to_dict(), (
+                'Expected {!r} but got {!r}'.format(expected, dec))
+        assert pool.recycled >= 1
+        assert [d.raw for d in pool.decode(filenames[:2], try_harder=True)] == [d.raw for d in test_reader.decode(filenames[:2])]
+        dec, err = pool.decode([filenames[0], os.path.join(test_barcode_dir, 'bad_format.png')], errors='return')
+        assert dec and isinstance(err, zxing.BarCodeReaderException)
+
+        # A job which fails doesn't take its worker down with it
+        with helper.assertRaises(zxing.BarCodeReaderException):
+            pool.decode(filenames[0], possible_formats='NOT_A_FORMAT')
+        reply = pool._run(dict(id=0, uris=[pathlib.Path(filenames[0]).absolute().as_uri()], options=dict(bogus=True)),
+                          None, zxing.DecodeStats())
+        assert reply['error']['message'].startswith('Unexpected error in worker process')
+        assert pool.killed == 0
+
+        with helper.assertRaises(zxing.BarCodeReaderException) as cm:
+            pool.decode(filenames[0], timeout=0.000001)
+        assert isinstance(cm.exception.__cause__, TimeoutError)
+        assert pool.killed == 1
+        # The stuck worker has been replaced
+        assert pool.decode(filenames[0]).raw == test_reader.decode(filenames[0]).raw
+
+
+def test_bad_backend():
+    with helper.assertRaises(ValueError):
+        zxing.BarCodeReader(backend='carrier_pigeon')
+
+
 def test_wrong_formats():
     all_test_formats = {fmt for fn, fmt, raw in test_barcodes}
     yield from ((_check_decoding, filename, expected_format, None, dict(possible_formats=all_test_formats - {expected_format}))
                 for filename, expected_format, expected_raw in test_barcodes)
 
 
+def test_lazy_import():
+    # "import zxing" should not pull in slow-to-import modules which it may not need
+    code = 'import sys, zxing; print(*(m for m in ("PIL", "asyncio", "concurrent.futures", "zipfile") if m in sys.modules))'
+    imported = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.join(os.path.dirname(__file__), '..'))
+    assert imported.strip() == b'', 'Expected no slow imports, but got {}'.format(imported.decode())
+
+
+def test_known_version():
+    test_reader = zxing.BarCodeReader(classpath=mkdtemp(), zxing_version='3.5.3')
+    assert test_reader.zxing_version_info == (3, 5, 3)
+    assert test_reader.core_jar is None
+
+
+def test_decode_stats():
+    reported = []
+    test_reader = zxing.BarCodeReader(on_stats=reported.append, jvm_timings=True)
+    filenames = [os.path.join(test_barcode_dir, fn) for fn in ('QR_CODE-easy.png', 'empty.png')]
+    test_reader.decode(filenames)
+    stats = test_reader.last_stats
+    assert reported == [stats]
+    assert (stats.method, stats.images, stats.barcodes, stats.subprocesses, stats.error) == ('decode', 2, 1, 1, None)
+    assert stats.stdout_bytes > 0
+    assert 0 < stats.java_time < stats.total_time
+    if stats.jvm_phases is not None:
+        assert 0 < stats.jvm_startup_time < stats.java_time
+
+    with helper.assertRaises(zxing.BarCodeReaderException):
+        test_reader.decode(os.path.join(test_barcode_dir, 'nonexistent.png'))
+    assert reported[-1].error == "Java library could not read image"
+
+    list(test_reader.iter_decode(filenames))
+    assert (reported[-1].method, reported[-1].barcodes, len(reported)) == ('iter_decode', 1, 3)
+
+
+def test_jvm_options():
+    fn = os.path.join(test_barcode_dir, test_barcodes[0][0])
+    test_reader = zxing.BarCodeReader(jvm_options=['-Xmx64m', '-XX:+UseSerialGC'])
+    assert test_reader.decode(fn).raw == test_barcodes[0][2]
+    with helper.assertRaises(zxing.BarCodeReaderException):
+        zxing.BarCodeReader(jvm_options=['-XX:+NoSuchOption']).decode(fn)
+
+
+def test_cds_archive():
+    from zxing import cds
+    if (cds.java_major_version(cds.java_version('java')) or 0) < 11:
+        raise unittest.SkipTest("AppCDS needs Java 11+")
+    archive = os.path.join(mkdtemp(), 'zxing.jsa')
+    test_reader = zxing.BarCodeReader(cds_archive=archive)
+    fn = os.path.join(test_barcode_dir, test_barcodes[0][0])
+    assert test_reader.decode(fn).raw == test_barcodes[0][2]
+    assert os.path.getsize(archive) > 0
+    assert '-XX:SharedArchiveFile=' + archive in test_reader._build_cmd([fn], False, None, False, False)
+
+    # A corrupt archive should be silently ignored by the JVM
+    garbage = os.path.join(mkdtemp(), 'garbage.jsa')
+    with open(garbage, 'wb') as f:
+        f.write(b'not a CDS archive')
+    assert zxing.BarCodeReader(cds_archive=garbage).decode(fn).raw == test_barcodes[0][2]
+
+    # With the default classpath, the archive goes next to the JARs, and must not change the name of the next one
+    first, second = zxing.BarCodeReader(cds_archive='auto'), zxing.BarCodeReader(cds_archive='auto')
+    assert first.decode(fn).raw == test_barcodes[0][2]
+    version_output = cds.java_version(first.java)
+    assert cds.default_archive_path(first, version_output) == cds.default_archive_path(second, version_output)
+    assert first._build_cmd([fn], False, None, False, False) == second._build_cmd([fn], False, None, False, False)
+
+
 def test_bad_java():
     test_reader = zxing.BarCodeReader(java=os.devnull)
     with helper.assertRaises(zxing.BarCodeReaderException):
@@ -189,6 +711,209 @@ def test_bad_file_format_error():
         test_reader.decode(os.path.join(test_barcode_dir, 'bad_format.png'))
 
 
+@with_setup(setup_reader)
+def test_errors_returned():
+    global test_reader
+    # A PNG which passes the Python-side checks, but which Java can't read
+    with open(os.path.join(test_barcode_dir, 'QR_CODE-easy.png'), 'rb') as f:
+        truncated = os.path.join(mkdtemp(), 'truncated.png')
+        with open(truncated, 'wb') as out:
+            out.write(f.read(60))
+    names = ('QR_CODE-easy.png', 'nonexistent.png', 'AZTEC-easy.jpg', 'bad_format.png', 'empty.png')
+    filenames = [os.path.join(test_barcode_dir, fn) for fn in names]
+    filenames.insert(3, truncated)
+
+    with helper.assertRaises(zxing.BarCodeReaderException) as cm:
+        test_reader.decode(filenames)
+    assert cm.exception.filename == filenames[1]
+
+    good, missing, aztec, trunc, bad, empty = test_reader.decode(filenames, errors='return')
+    assert good.raw == 'This should be QR_CODE' and aztec.raw == 'This should be AZTEC'
+    assert not empty and empty.path == filenames[-1]
+    for e, fn in ((missing, filenames[1]), (bad, filenames[4])):
+        assert isinstance(e, zxing.BarCodeReaderException) and e.filename == fn
+    assert isinstance(trunc, zxing.BarCodeReaderException)
+    assert isinstance(test_reader.decode(filenames[1], errors='return'), zxing.BarCodeReaderException)
+
+    # Errors which aren't the fault of any one image are still raised, without retrying each image
+    broken = zxing.BarCodeReader(jvm_options=['-XX:+NoSuchOption'])
+    with helper.assertRaises(zxing.BarCodeReaderException) as cm:
+        broken.decode([filenames[0], filenames[2], filenames[-1]], errors='return')
+    assert broken.last_stats.subprocesses == 1
+    with helper.assertRaises(zxing.BarCodeReaderException):
+        test_reader.decode([filenames[0], filenames[2]], possible_formats='NOT_A_FORMAT', errors='return')
+
+
+def test_cli_jsonl():
+    import json
+    filenames = [os.path.join(test_barcode_dir, fn) for fn in ('QR_CODE-easy.png', 'nonexistent.png', 'empty.png')]
+    p = subprocess.run([sys.executable, '-m', 'zxing', '--jsonl', '--jobs', '2'] + filenames,
+                       stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert p.returncode == 1
+    results = {d['filename']: d for d in map(json.loads, p.stdout.splitlines())}
+    assert results[filenames[0]]['raw'] == 'This should be QR_CODE'
+    assert results[filenames[1]]['error'].startswith('Java library could not read image')
+    assert results[filenames[2]]['format'] is None
+
+
+def test_cli_repeated_arguments():
+    global test_reader
+    import csv
+    filenames = [os.path.join(test_barcode_dir, fn) for fn in ('empty.png', 'QR_CODE-easy.png', 'QR_CODE-easy.png')]
+    p = subprocess.run([sys.executable, '-m', 'zxing', '--csv'] + filenames, stdout=subprocess.PIPE,
+                       universal_newlines=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert p.returncode == 0
+    rows = list(csv.reader(p.stdout.splitlines()))[1:]
+    assert [(row[0], row[3]) for row in rows] == [(filenames[0], ''), (filenames[1], 'This should be QR_CODE'),
+                                                  (filenames[2], 'This should be QR_CODE')]
+
+    # An item without a result gets an error, rather than being skipped
+    from zxing.__main__ import _decode_items
+
+    class ForgetfulReader(object):
+        def iter_decode(self, filenames, **options):
+            yield from test_reader.iter_decode(filenames[:-1], **options)
+
+    setup_reader()
+    results = list(_decode_items(ForgetfulReader(), [(ii, fn, fn) for ii, fn in enumerate(filenames)]))
+    assert [ii for ii, bc in results] == [0, 1, 2]
+    assert isinstance(results[2][1], zxing.BarCodeReaderException) and results[2][1].filename == filenames[2]
+
+
+@with_setup(setup_reader)
+def test_decode_manifest():
+    global test_reader
+    import json
+    from zxing.manifest import decode_manifest
+    td = mkdtemp()
+    names = ['QR_CODE-easy.png', 'nonexistent.png', 'empty.png', 'AZTEC-easy.jpg', 'CODE_128-easy.jpg']
+    manifest = os.path.join(td, 'manifest.txt')
+    with open(manifest, 'w') as f:
+        f.write('\r\n\n'.join(os.path.join(test_barcode_dir, fn) for fn in names))
+    output, checkpoint = os.path.join(td, 'results.jsonl'), os.path.join(td, 'results.ckpt')
+
+    counts = decode_manifest(test_reader, manifest, output, checkpoint, batch_size=2)
+    assert counts == dict(records=5, barcodes=3, errors=1)
+    with open(output, 'rb') as f:
+        complete = f.read()
+    results = [json.loads(line) for line in complete.splitlines()]
+    assert [r['index'] for r in results] == list(range(5))
+    assert [r.get('raw') for r in results] == ['This should be QR_CODE', None, None, 'This should be AZTEC', 'This should be CODE_128']
+    assert 'error' in results[1]
+
+    # Pretend that it was interrupted after the first batch, in the middle of writing the second
+    first_batch = len(b''.join(complete.splitlines(True)[:2]))
+    with open(output, 'wb') as f:
+        f.write(complete[:first_batch + 10])
+    with open(checkpoint, 'w') as f:
+        json.dump(dict(records=2, output_bytes=first_batch), f)
+    counts = decode_manifest(test_reader, manifest, output, checkpoint, batch_size=2, jobs=2)
+    assert counts == dict(records=3, barcodes=2, errors=0)
+    with open(output, 'rb') as f:
+        assert f.read() == complete
+
+
+def _check_hot_folder(inotify):
+    import json
+    import threading
+    import time
+    from zxing.watch import HotFolder
+
+    td = mkdtemp()
+    shutil.copy(os.path.join(test_barcode_dir, 'empty.png'), td)
+    results = []
+    hf = HotFolder(test_reader, td, poll_interval=0.1, inotify=inotify, on_result=lambda *args: results.append(args))
+    t = threading.Thread(target=hf.run)
+    t.start()
+    try:
+        for fn in ('QR_CODE-easy.png', 'AZTEC-easy.jpg', 'bad_format.png'):
+            shutil.copy(os.path.join(test_barcode_dir, fn), td)
+        with open(os.path.join(td, '.partial.png'), 'wb') as f:
+            f.write(b'ignored')
+        deadline = time.monotonic() + 60
+        while len(results) < 4 and time.monotonic() < deadline:
+            time.sleep(0.1)
+    finally:
+        hf.stop()
+        t.join()
+
+    assert sorted(os.listdir(td)) == ['.partial.png', 'done', 'failed']
+    assert sorted(os.listdir(os.path.join(td, 'done'))) == [
+        'AZTEC-easy.jpg', 'AZTEC-easy.jpg.json', 'QR_CODE-easy.png', 'QR_CODE-easy.png.json']
+    assert sorted(os.listdir(os.path.join(td, 'failed'))) == ['bad_format.png', 'bad_format.png.json', 'empty.png', 'empty.png.json']
+    with open(os.path.join(td, 'done', 'QR_CODE-easy.png.json')) as f:
+        assert json.load(f)['raw'] == 'This should be QR_CODE'
+    with open(os.path.join(td, 'failed', 'bad_format.png.json')) as f:
+        assert 'error' in json.load(f)
+
+
+@with_setup(setup_reader)
+def test_hot_folder():
+    yield _check_hot_folder, False
+    if sys.platform.startswith('linux'):
+        yield _check_hot_folder, True
+
+
+@with_setup(setup_reader)
+def test_decode_server():
+    import base64
+    import json
+    import threading
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+    from zxing.serve import DecodeServer
+
+    server = DecodeServer(test_reader, port=0, max_queue=2)
+    t = threading.Thread(target=server.serve_forever)
+    t.start()
+    try:
+        url = 'http://%s:%d' % server.address[:2]
+
+        def post(body, content_type='application/octet-stream', query=''):
+            with urlopen(Request(url + '/decode' + query, body, {'Content-Type': content_type})) as r:
+                return json.load(r)['results']
+
+        with open(os.path.join(test_barcode_dir, 'QR_CODE-easy.png'), 'rb') as f:
+            qr = f.read()
+        with open(os.path.join(test_barcode_dir, 'bad_format.png'), 'rb') as f:
+            bad = f.read()
+
+        # Concurrent requests are coalesced
+        results = [None] * 2
+        threads = [threading.Thread(target=lambda ii: results.__setitem__(ii, post(qr)), args=(ii,)) for ii in range(2)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        assert [r[0]['raw'] for r in results] == ['This should be QR_CODE'] * 2
+
+        def multipart(*files):
+            return b''.join(b'--xyzzy\r\nContent-Disposition: form-data; name="f"; filename="%s"\r\n\r\n%s\r\n' % f
+                            for f in files) + b'--xyzzy--\r\n'
+
+        r1, r2 = post(multipart((b'qr.png', qr), (b'bad.png', bad)), 'multipart/form-data; boundary=xyzzy',
+                      '?possible_formats=QR_CODE')
+        assert r1['filename'] == 'qr.png' and r1['format'] == 'QR_CODE'
+        assert r2['filename'] == 'bad.png' and 'error' in r2
+        [r] = post(b'data:image/png;base64,' + base64.b64encode(qr), 'text/plain')
+        assert r['raw'] == 'This should be QR_CODE'
+
+        # More images than the queue can hold
+        with helper.assertRaises(HTTPError) as cm:
+            post(multipart(*[(b'qr.png', qr)] * 3), 'multipart/form-data; boundary=xyzzy')
+        assert cm.exception.code == 503
+
+        with urlopen(url + '/metrics') as r:
+            metrics = r.read().decode()
+        assert 'zxing_queue_depth 0' in metrics
+        assert 'zxing_requests_total{status="200"} 4' in metrics
+        assert 'zxing_requests_total{status="503"} 1' in metrics
+        assert 'zxing_request_duration_seconds_count 5' in metrics
+    finally:
+        server.shutdown()
+        t.join()
+
+
 def test_data_uris():
     def _check_data_uri(uri, contents, suffix):
         fobj = zxing.data_uri_to_fobj(uri)
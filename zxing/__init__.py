@@ -6,30 +6,36 @@
 #  library:  http://code.google.com/p/zxing/
 #
 
-import glob
+# Modules which are slow to import (PIL, asyncio, concurrent.futures, tempfile, zipfile, etc) are
+# only imported when they are actually needed, so that "import zxing" stays fast.
+
+import numbers
 import os
-import pathlib
 import re
 import subprocess as sp
 import sys
-import urllib.parse
-import zipfile
-from base64 import b64decode
+import threading
 from enum import Enum
 from io import BytesIO, IOBase
-from itertools import chain
-
-try:
-    from PIL.Image import Image
-    from tempfile import NamedTemporaryFile
-    have_pil = True
-except ImportError:
-    have_pil = None
+from time import perf_counter
 
 from .version import __version__  # noqa: F401
 
 
+def _pil_image_class():
+    # If PIL hasn't been imported, nobody can have passed us a PIL image
+    m = sys.modules.get('PIL.Image')
+    return m.Image if m else None
+
+
+def _ndarray_class():
+    # Likewise for NumPy arrays
+    m = sys.modules.get('numpy')
+    return m.ndarray if m else None
+
+
 def file_uri_to_path(s):
+    import urllib.parse
     uri = urllib.parse.urlparse(s)
     if (uri.scheme, uri.netloc, uri.query, uri.fragment) != ('file', '', '', ''):
         raise ValueError(uri)
@@ -37,6 +43,8 @@ def file_uri_to_path(s):
 
 
 def data_uri_to_fobj(s):
+    import urllib.parse
+    from base64 import b64decode
     r = urllib.parse.urlparse(s)
     if r.scheme == 'data' and not r.netloc:
         mime, *rest = r.path.split(',', 1)
@@ -52,18 +60,303 @@ def data_uri_to_fobj(s):
     raise ValueError("Cannot handle URIs other than data:MIMETYPE[;base64],DATA")
 
 
+# PIL image modes which can be converted to 8-bit grayscale without losing anything that ZXing would use
+_gray_modes = ('1', 'L', 'LA', 'P', 'PA', 'RGB', 'RGBA', 'RGBX', 'CMYK', 'YCbCr')
+
+
+def _to_grayscale(im):
+    if im.mode in ('1', 'L'):
+        return im
+    elif im.mode in ('LA', 'PA', 'RGBA') or (im.mode == 'P' and 'transparency' in im.info):
+        # ZXing's BufferedImageLuminanceSource treats fully-transparent pixels as white
+        im = im.convert('RGBA')
+        gray = im.convert('L')
+        gray.paste(255, mask=im.getchannel('A').point(lambda a: 255 if a == 0 else 0))
+        return gray
+    return im.convert('L')
+
+
+def _is_single_image_array(a):
+    # (H, W) grayscale or (H, W, C) with 1, 3 or 4 channels; anything else is treated as a stack of images
+    return a.ndim == 2 or (a.ndim == 3 and a.shape[2] in (1, 3, 4))
+
+
+def _array_to_grayscale(a, channel_order='RGB'):
+    # Reduce a uint8 image array to luminance exactly as ZXing's BufferedImageLuminanceSource does, including
+    # treating fully-transparent pixels as white
+    import numpy as np
+    if a.dtype != np.uint8:
+        raise ValueError("NumPy image arrays must have dtype uint8, not %s" % a.dtype)
+    if a.ndim == 3 and a.shape[2] == 1:
+        a = a[:, :, 0]
+    if a.ndim == 2:
+        return np.ascontiguousarray(a)
+    if a.ndim != 3 or a.shape[2] not in (3, 4):
+        raise ValueError("NumPy image arrays must have shape (H, W), (H, W, 1), (H, W, 3) or (H, W, 4), not %r" % (a.shape,))
+    r, g, b = (a[:, :, channel_order.index(c)].astype(np.uint32) for c in 'RGB')
+    gray = ((306 * r + 601 * g + 117 * b + 0x200) >> 10).astype(np.uint8)
+    if a.shape[2] == 4:
+        gray[a[:, :, 3] == 0] = 0xff
+    return gray
+
+
+def _write_gray_bmp(f, a):
+    # Write a 2-D uint8 array as an 8-bit grayscale BMP. It's stored top-down (negative height), so that rows can be
+    # written in order straight from the array; if they don't need padding, the whole array is written at once.
+    import struct
+    h, w = a.shape
+    stride = (w + 3) & ~3
+    offset = 14 + 40 + 256 * 4
+    f.write(struct.pack('<2sIHHI', b'BM', offset + stride * h, 0, 0, offset))
+    f.write(struct.pack('<IiiHHIIiiII', 40, w, -h, 1, 8, 0, stride * h, 2835, 2835, 256, 256))
+    f.write(bytes(c for ii in range(256) for c in (ii, ii, ii, 0)))
+    if stride == w:
+        f.write(a.data)
+    else:
+        pad = bytes(stride - w)
+        for row in a:
+            f.write(row.data)
+            f.write(pad)
+
+
+def _is_box(roi):
+    # Also NumPy scalars, as in tuple(np.array([left, top, right, bottom]))
+    return len(roi) == 4 and all(isinstance(n, numbers.Real) for n in roi)
+
+
+def _crop_and_shrink(im, box, max_dimension, channel_order='RGB'):
+    # Crop a PIL image or NumPy array to box=(left, top, right, bottom), convert it to grayscale, and shrink it by an
+    # integer factor so that neither side is longer than max_dimension. Returns (image, factor, left, top), so that a
+    # point (x, y) in the result is at (x * factor + left, y * factor + top) in the original image. The image is None
+    # if the box doesn't overlap the image at all.
+    ndarray = _ndarray_class()
+    is_array = ndarray and isinstance(im, ndarray)
+    w, h = (im.shape[1], im.shape[0]) if is_array else im.size
+    if box is None:
+        left, top, right, bottom = 0, 0, w, h
+    else:
+        left, top = min(w, max(0, int(box[0]))), min(h, max(0, int(box[1])))
+        right, bottom = min(w, int(-(-box[2] // 1))), min(h, int(-(-box[3] // 1)))
+        if right <= left or bottom <= top:
+            return None, 1, left, top
+    factor = max(1, -(-max(right - left, bottom - top) // max_dimension)) if max_dimension else 1
+
+    if is_array:
+        # Crop first (which is just a view of the array), so that only the region is converted
+        gray = _array_to_grayscale(im[top:bottom, left:right], channel_order)
+        if factor > 1:
+            import numpy as np
+            hh, ww = gray.shape[0] // factor, gray.shape[1] // factor
+            gray = (gray[:hh * factor, :ww * factor].reshape(hh, factor, ww, factor).sum(axis=(1, 3), dtype=np.uint32)
+                    // (factor * factor)).astype(np.uint8)
+    else:
+        gray = _to_grayscale(im.crop((left, top, right, bottom)) if (left, top, right, bottom) != (0, 0, w, h) else im)
+        if factor > 1:
+            gray = gray.convert('L').reduce(factor)
+    return gray, factor, left, top
+
+
+def _preprocess(fn_or_im, how, channel_order='RGB'):
+    # Returns (grayscale image, function to map a BarCode for the image back to the original) for decode(strategy=...)
+    import pathlib
+    Image, ndarray = _pil_image_class(), _ndarray_class()
+    uri = None
+    if ndarray and isinstance(fn_or_im, ndarray):
+        im = _array_to_grayscale(fn_or_im, channel_order)
+    elif Image and isinstance(fn_or_im, Image):
+        im = _to_grayscale(fn_or_im)
+    else:
+        from PIL import Image
+        with Image.open(fn_or_im) as im:
+            im = _to_grayscale(im)
+            im.load()
+        if not isinstance(fn_or_im, IOBase):
+            uri = pathlib.Path(fn_or_im).absolute().as_uri()
+    is_array = ndarray and isinstance(im, ndarray)
+
+    if how == 'invert':
+        im, unmap = (255 - im) if is_array else im.convert('L').point(lambda v: 255 - v), None
+    elif how == 'rotate90':
+        # 90° counter-clockwise, which moves pixel (x, y) to (y, width - 1 - x)
+        width = im.shape[1] if is_array else im.width
+        im = im[:, ::-1].T if is_array else im.rotate(90, expand=True)
+        unmap = lambda x, y: (width - 1 - y, x)  # noqa: E731
+    else:
+        raise ValueError("Unknown preprocessing %r (should be 'invert' or 'rotate90')" % how)
+
+    def undo(bc):
+        if uri is not None:
+            bc.uri = uri
+        if unmap and bc.points:
+            bc.points = [unmap(x, y) for x, y in bc.points]
+        return bc
+    return im, undo
+
+
+def roi_from_barcode(barcode, margin=0.5):
+    '''Returns a region of interest (left, top, right, bottom) around the points of a decoded barcode, extended on each
+       side by `margin` times the size of the barcode. Pass it as decode(..., roi=...) to look for the barcode in the
+       same place in the next image, for example in successive frames from a camera. Returns None if the barcode
+       doesn't have any points.'''
+    if not barcode or not barcode.points:
+        return None
+    xs, ys = [p[0] for p in barcode.points], [p[1] for p in barcode.points]
+    # 1-D barcodes only have points along a line, so use the larger dimension for both
+    size = max(max(xs) - min(xs), max(ys) - min(ys), 1)
+    return (max(0, int(min(xs) - margin * size)), max(0, int(min(ys) - margin * size)),
+            int(max(xs) + margin * size) + 1, int(max(ys) + margin * size) + 1)
+
+
+def _scratch_dir(size, _candidates=('/dev/shm',)):
+    # Use a RAM-backed filesystem for temporary images if there is one with plenty of room (otherwise, default tempdir)
+    for d in _candidates:
+        try:
+            st = os.statvfs(d)
+        except (AttributeError, OSError):
+            continue
+        if os.access(d, os.W_OK | os.X_OK) and st.f_bavail * st.f_frsize > 4 * size + (1 << 20):
+            return d
+
+
+def _real_file_name(fobj):
+    # If a file object is just an open file on disk, which hasn't been read from, Java can read the file itself
+    name = getattr(fobj, 'name', None)
+    if isinstance(name, str):
+        try:
+            if fobj.tell() == 0 and os.path.samestat(os.fstat(fobj.fileno()), os.stat(name)):
+                return name
+        except (OSError, ValueError):
+            pass
+
+
+def _file_not_found_error(message):
+    # Java's FileNotFoundException message looks like: "$FILENAME ({No such file or directory,Permission denied,*})"
+    fn, err = (message.rsplit(' (', 1) + [''])[:2]
+    if err == 'No such file or directory)':
+        return fn, FileNotFoundError(fn)
+    elif err == 'Permission denied)':
+        return fn, PermissionError(fn)
+    else:
+        return fn, OSError(err[:-1])
+
+
+# Magic numbers of the image formats which Java's ImageIO can read (WBMP has none, but always starts with two zero bytes)
+_image_signatures = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'BM', b'II*\x00', b'MM\x00*', b'\x00\x00')
+
+
+def _check_images(file_uris):
+    # Returns {URI: BarCodeReaderException} for the files which don't exist, can't be read, or aren't images
+    failed = {}
+    for uri in file_uris:
+        fn = file_uri_to_path(uri)
+        try:
+            with open(fn, 'rb') as f:
+                head = f.read(8)
+        except OSError as e:
+            failed[uri] = BarCodeReaderException("Java library could not read image", fn)
+            failed[uri].__cause__ = e
+        else:
+            if not head.startswith(_image_signatures):
+                failed[uri] = BarCodeReaderException("Java library could not read image (is it in a supported format?)", fn)
+    return failed
+
+
 class BarCodeReaderException(Exception):
     def __init__(self, message, filename=None):
         self.message, self.filename = message, filename
         super().__init__(message, filename)
 
 
+class DecodeStats(object):
+    '''Timings (in seconds) and counts for a single call to one of BarCodeReader's decoding methods. Used as a context
+       manager around the call, which records any error and the total time, and then reports the stats to the reader.'''
+
+    fields = ('method', 'backend', 'images', 'barcodes', 'cache_hits', 'temp_files', 'materialize_time', 'subprocesses',
+              'launch_time', 'java_time', 'stdout_bytes', 'parse_time', 'total_time', 'jvm_startup_time', 'jvm_phases',
+              'error')
+
+    def __init__(self, reader=None, method=None):
+        self.reader, self.method = reader, method
+        self.backend = reader.backend if reader else None
+        self.images = self.barcodes = self.cache_hits = self.temp_files = self.subprocesses = self.stdout_bytes = 0
+        self.materialize_time = self.launch_time = self.java_time = self.parse_time = self.total_time = 0.0
+        self.jvm_startup_time, self.jvm_phases = None, None  # Only with BarCodeReader(jvm_timings=True)
+        self.error = None  # Message of the BarCodeReaderException raised, if any
+        self._lock = threading.Lock()
+        self._t0 = perf_counter()
+
+    def add(self, **amounts):
+        # Decoding methods may run several subprocesses at once, in different threads
+        with self._lock:
+            for k, v in amounts.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def add_jvm_log(self, log):
+        # Lines from -Xlog:startuptime look like "Create VM, 0.0687817 secs"
+        with self._lock:
+            if self.jvm_phases is None:
+                self.jvm_startup_time, self.jvm_phases = 0.0, {}
+            for m in re.finditer(rb"^(.+), ([\d.]+) secs$", log, re.M):
+                phase, secs = m.group(1).decode(), float(m.group(2))
+                self.jvm_phases[phase] = self.jvm_phases.get(phase, 0.0) + secs
+                if phase == 'Create VM':
+                    self.jvm_startup_time += secs
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.fields}
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ', '.join('{}={!r}'.format(k, getattr(self, k)) for k in self.fields))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if isinstance(exc, BarCodeReaderException):
+            self.error = exc.message
+        elif exc is not None and not isinstance(exc, GeneratorExit):
+            self.error = exc_type.__name__
+        self.total_time = perf_counter() - self._t0
+        if self.reader is not None:
+            self.reader.last_stats = self
+            if self.reader.on_stats is not None:
+                self.reader.on_stats(self)
+
+
 class BarCodeReader(object):
     cls = "com.google.zxing.client.j2se.CommandLineRunner"
     classpath_sep = ';' if os.name == 'nt' else ':'  # https://stackoverflow.com/a/60211688
 
-    def __init__(self, classpath=None, java=None):
+    backends = ('subprocess', 'jpype')
+
+    # Passes for decode(strategy='adaptive'): (name, options to override)
+    adaptive_passes = (
+        ('fast', {}),
+        ('try_harder', dict(try_harder=True)),
+        ('pure_barcode', dict(try_harder=True, pure_barcode=True)),
+        ('inverted', dict(try_harder=True, preprocess='invert')),
+    )
+
+    # classpath -> (core_jar, (mtime, size) of core_jar, zxing_version), shared by all instances
+    _classpath_cache = {}
+
+    def __init__(self, classpath=None, java=None, backend='subprocess', cache=None, zxing_version=None,
+                 jvm_options=(), cds_archive=None, on_stats=None, jvm_timings=False, channel_order='RGB'):
+        if backend not in self.backends:
+            raise ValueError("backend must be one of %s" % ', '.join(map(repr, self.backends)))
         self.java = java or 'java'
+        self.backend = backend
+        self.cache = cache
+        self.jvm_options = list(jvm_options)
+        self.cds_archive = cds_archive
+        self._jvm_args = None
+        self.on_stats = on_stats
+        self.jvm_timings = jvm_timings
+        if channel_order not in ('RGB', 'BGR', 'RGBA', 'BGRA'):
+            raise ValueError("channel_order must be 'RGB', 'BGR', 'RGBA' or 'BGRA'")
+        self.channel_order = channel_order
+        self.last_stats = None
+        self._jvm_major_version = None
         self.zxing_version = self.zxing_version_info = None
         if classpath:
             self.classpath = classpath if isinstance(classpath, str) else self.classpath_sep.join(classpath)
@@ -72,47 +365,629 @@ class BarCodeReader(object):
         else:
             self.classpath = os.path.join(os.path.dirname(__file__), 'java', '*')
 
-        for fn in chain.from_iterable(glob.glob(cp) for cp in self.classpath.split(self.classpath_sep)):
-            if os.path.basename(fn) == 'core.jar':
-                self.core_jar = fn
-                with zipfile.ZipFile(self.core_jar) as c:
-                    for line in c.open('META-INF/MANIFEST.MF'):
-                        if line.startswith(b'Bundle-Version: '):
-                            self.zxing_version = line.split(b' ', 1)[1].strip().decode()
-                            self.zxing_version_info = tuple(int(n) for n in self.zxing_version.split('.'))
-                            break
-                return
-        raise BarCodeReaderException("Java JARs not found in classpath (%s)" % self.classpath, self.classpath)
-
-    def decode(self, filenames, try_harder=False, possible_formats=None, pure_barcode=False, products_only=False):
-        possible_formats = (possible_formats,) if isinstance(possible_formats, str) else possible_formats
-
-        if isinstance(filenames, (str, IOBase, Image) if have_pil else (str, IOBase)):
-            one_file = True
-            filenames = filenames,
+        if zxing_version:
+            # Trust the caller, and don't look at the JARs at all
+            self.core_jar = None
+            self.zxing_version = zxing_version
+        else:
+            self.core_jar, self.zxing_version = self._inspect_classpath(self.classpath)
+        if self.zxing_version:
+            self.zxing_version_info = tuple(int(n) for n in self.zxing_version.split('.'))
+
+    @classmethod
+    def _inspect_classpath(cls, classpath):
+        cached = cls._classpath_cache.get(classpath)
+        if cached:
+            core_jar, stat, zxing_version = cached
+            try:
+                st = os.stat(core_jar)
+            except OSError:
+                pass
+            else:
+                if (st.st_mtime_ns, st.st_size) == stat:
+                    return core_jar, zxing_version
+
+        import glob
+        import zipfile
+        for cp in classpath.split(cls.classpath_sep):
+            for fn in glob.glob(cp):
+                if os.path.basename(fn) == 'core.jar':
+                    zxing_version = None
+                    with zipfile.ZipFile(fn) as c:
+                        for line in c.open('META-INF/MANIFEST.MF'):
+                            if line.startswith(b'Bundle-Version: '):
+                                zxing_version = line.split(b' ', 1)[1].strip().decode()
+                                break
+                    st = os.stat(fn)
+                    cls._classpath_cache[classpath] = (fn, (st.st_mtime_ns, st.st_size), zxing_version)
+                    return fn, zxing_version
+        raise BarCodeReaderException("Java JARs not found in classpath (%s)" % classpath, classpath)
+
+    def decode(self, filenames, try_harder=False, possible_formats=None, pure_barcode=False, products_only=False,
+               batch_size=None, max_cmdline_bytes=None, roi=None, max_dimension=None, strategy=None, errors='raise',
+               multi=False):
+        if errors not in ('raise', 'return'):
+            raise ValueError("errors must be 'raise' or 'return'")
+        if multi and (strategy is not None or roi is not None or max_dimension):
+            raise ValueError("multi=True cannot be combined with strategy, roi or max_dimension")
+        if strategy is not None:
+            return self._decode_adaptive(filenames, self.adaptive_passes if strategy == 'adaptive' else strategy,
+                                         try_harder=try_harder, possible_formats=possible_formats,
+                                         pure_barcode=pure_barcode, products_only=products_only, batch_size=batch_size,
+                                         max_cmdline_bytes=max_cmdline_bytes, roi=roi, max_dimension=max_dimension,
+                                         errors=errors)
+        if roi is not None or max_dimension:
+            return self._decode_regions(filenames, roi, max_dimension, try_harder=try_harder,
+                                        possible_formats=possible_formats, pure_barcode=pure_barcode,
+                                        products_only=products_only, batch_size=batch_size,
+                                        max_cmdline_bytes=max_cmdline_bytes, errors=errors)
+
+        with DecodeStats(self, 'decode') as stats:
+            possible_formats = (possible_formats,) if isinstance(possible_formats, str) else possible_formats
+            one_file, file_uris, temp_files = self._prepare(filenames, stats)
+            options = (try_harder, possible_formats, pure_barcode, products_only) + ((True,) if multi else ())
+
+            try:
+                # With errors='return', files which obviously aren't images are weeded out before Java sees them
+                failed = {} if errors == 'raise' else _check_images(file_uris)
+                lookup = self._lookup([uri for uri in file_uris if uri not in failed], options, stats)
+                uris = [uri for uri in file_uris if uri not in failed] if lookup is None else lookup.misses
+                if multi:
+                    # The output blocks can only be told apart by their URIs, so decode each file just once
+                    uris = list(dict.fromkeys(uris))
+                if errors == 'return':
+                    codes = self._decode_isolating(uris, options, batch_size, max_cmdline_bytes, stats, failed)
+                elif self.backend == 'jpype':
+                    codes = self._decode_jpype(uris, options, stats)
+                else:
+                    codes = []
+                    for batch in self._batches(uris, batch_size, max_cmdline_bytes, *options):
+                        codes += self._decode_subprocess(self._build_cmd(batch, *options), stats=stats)
+                if multi:
+                    codes = self._group_by_uri(codes, [uri for uri in uris if uri not in failed])
+                if lookup is not None:
+                    for uri in [uri for uri in failed if uri in uris]:
+                        # Duplicates of an image which couldn't be decoded fail the same way
+                        failed.update(dict.fromkeys(lookup.discard(uri), failed[uri]))
+                    codes = lookup.complete(codes)
+            finally:
+                for tf in temp_files:
+                    tf.close()
+
+            stats.barcodes = sum(len(c) if multi else 1 for c in codes if c)
+            if multi and not one_file:
+                d = {c.uri: c for c in codes}
+                d.update(failed)
+                # Each repeat of the same file gets its own copy of the BarCodes
+                results, seen = [], set()
+                for uri in file_uris:
+                    results.append(d[uri]._with_uri(uri) if uri in seen and isinstance(d[uri], BarCodes) else d[uri])
+                    seen.add(uri)
+                return results
+            if failed:
+                d = {c.uri: c for c in codes}
+                d.update(failed)
+                return d[file_uris[0]] if one_file else [d[uri] for uri in file_uris]
+            return self._reorder(codes, file_uris, one_file)
+
+    @staticmethod
+    def _group_by_uri(codes, file_uris):
+        # With --multi, CommandLineRunner outputs a block for each barcode found, so there can be several per URI
+        groups = {uri: BarCodes(uri) for uri in file_uris}
+        for c in codes:
+            if c:
+                groups[c.uri].append(c)
+        return list(groups.values())
+
+    def _decode_isolating(self, uris, options, batch_size, max_cmdline_bytes, stats, failed):
+        # Decodes the URIs, putting a BarCodeReaderException into failed for each one which Java can't read, rather
+        # than letting it spoil the results for the others. CommandLineRunner stops at the first file it can't read,
+        # so we keep its results up to that point, and retry the rest without that file. If we can't tell which file
+        # caused the error, we retry each half of the rest separately.
+        if self.backend == 'jpype':
+            codes = []
+            for uri in uris:
+                try:
+                    codes += self._decode_jpype([uri], options, stats)
+                except BarCodeReaderException as e:
+                    if not self._is_image_error(e):
+                        raise
+                    failed[uri] = e
+            return codes
+
+        codes = []
+        groups = list(self._batches(uris, batch_size, max_cmdline_bytes, *options))[::-1]
+        while groups:
+            group = groups.pop()
+            new_codes, error = self._decode_subprocess(self._build_cmd(group, *options), stats=stats, partial=True)
+            codes += new_codes
+            if error is None:
+                continue
+            elif not self._is_image_error(error):
+                raise error
+
+            done = {c.uri for c in new_codes}
+            rest = [uri for uri in group if uri not in done]
+            bad = next((uri for uri in rest if file_uri_to_path(uri) == error.filename), None)
+            if bad is None and len(rest) == 1:
+                bad = rest[0]
+            if bad is not None:
+                failed[bad] = error
+                rest.remove(bad)
+            elif not new_codes:
+                groups += [rest[len(rest) // 2:], rest[:len(rest) // 2]]
+                continue
+            if rest:
+                groups.append(rest)
+        return codes
+
+    def _is_image_error(self, e):
+        # Whether the exception is the fault of a particular image, rather than of Java, its options, or the classpath
+        return e.message.startswith('Java library could not read image')
+
+    def _decode_adaptive(self, filenames, passes, **kwargs):
+        # Decode all the images with the options of the first pass, then only those in which no barcode was found with
+        # the options of the next pass, and so on. Each pass is (name, options), and its options can include
+        # preprocess='invert' or 'rotate90', which are applied to the image before it's decoded.
+        if isinstance(passes, str):
+            raise ValueError("strategy must be 'adaptive' or a sequence of (name, options) passes")
+        one_file, inputs = self._split_inputs(filenames)
+        inputs = [BytesIO(fn_or_im.read()) if isinstance(fn_or_im, IOBase) and not fn_or_im.seekable() else fn_or_im
+                  for fn_or_im in inputs]
+        positions = {ii: fn_or_im.tell() for ii, fn_or_im in enumerate(inputs) if isinstance(fn_or_im, IOBase)}
+
+        results = [None] * len(inputs)
+        todo = list(range(len(inputs)))
+        for name, options in passes:
+            options = dict(options)
+            preprocess = options.pop('preprocess', None)
+            for ii in todo:
+                if ii in positions:
+                    inputs[ii].seek(positions[ii])
+            if preprocess is None:
+                batch, undo = [inputs[ii] for ii in todo], None
+            else:
+                batch, undo = zip(*(_preprocess(inputs[ii], preprocess, self.channel_order) for ii in todo)) if todo else ((), ())
+            codes = self.decode(list(batch), **dict(kwargs, **options))
+
+            still_todo = []
+            for jj, (ii, bc) in enumerate(zip(todo, codes)):
+                if isinstance(bc, BarCodeReaderException):
+                    results[ii] = bc
+                    continue
+                # Copy the result, since the same object may be in the cache
+                bc = bc._with_uri(bc.uri)
+                bc.decode_pass = name
+                if undo is not None:
+                    bc = undo[jj](bc)
+                # If no barcode is found by any pass, the result from the last one is returned
+                results[ii] = bc
+                if not bc:
+                    still_todo.append(ii)
+            todo = still_todo
+            if not todo:
+                break
+        return results[0] if one_file else results
+
+    def _decode_regions(self, filenames, roi, max_dimension, errors='raise', **kwargs):
+        # Crop each image to each region of interest and/or shrink it, decode them all together, and then map the
+        # points back to the original images. For each image, the result is the first region with a barcode.
+        import pathlib
+
+        one_file, inputs = self._split_inputs(filenames)
+        boxes = [None] if roi is None else [roi] if _is_box(roi) else list(roi)
+        crops, owners = [], []
+        results = [None] * len(inputs)
+        for ii, fn_or_im in enumerate(inputs):
+            Image, ndarray = _pil_image_class(), _ndarray_class()
+            if (ndarray and isinstance(fn_or_im, ndarray)) or (Image and isinstance(fn_or_im, Image)):
+                im, uri = fn_or_im, None
+            else:
+                from PIL import Image, UnidentifiedImageError
+                try:
+                    im = Image.open(fn_or_im)
+                    im.load()
+                except OSError as e:
+                    # The same exception which decode() would raise without cropping or shrinking
+                    fn = getattr(fn_or_im, 'name', fn_or_im)
+                    if isinstance(e, UnidentifiedImageError):
+                        exc = BarCodeReaderException("Java library could not read image (is it in a supported format?)", fn)
+                    else:
+                        exc = BarCodeReaderException("Java library could not read image", fn)
+                    if errors == 'raise':
+                        raise exc from e
+                    exc.__cause__ = e
+                    results[ii] = exc
+                    continue
+                uri = None if isinstance(fn_or_im, IOBase) else pathlib.Path(fn_or_im).absolute().as_uri()
+            for box in boxes:
+                crop, factor, left, top = _crop_and_shrink(im, box, max_dimension, self.channel_order)
+                if crop is None:
+                    # Nothing to decode, e.g. a previous frame's region which has moved out of this one
+                    results[ii] = results[ii] or BarCode(uri, None, None, None, None, None)
+                    continue
+                crops.append(crop)
+                owners.append((ii, uri, factor, left, top))
+
+        for bc, (ii, uri, factor, left, top) in zip(self.decode(crops, **kwargs) if crops else (), owners):
+            # Copy the result, since the same object may be in the cache
+            bc = bc._with_uri(uri or bc.uri)
+            if bc.points:
+                bc.points = [(x * factor + left, y * factor + top) for x, y in bc.points]
+            if results[ii] is None or (bc and not results[ii]):
+                results[ii] = bc
+        return results[0] if one_file else results
+
+    def _lookup(self, file_uris, options, stats):
+        if self.cache is not None:
+            lookup = self.cache.lookup(file_uris, options, self.zxing_version)
+            stats.cache_hits = len(lookup.hits)
+            return lookup
+
+    def _decode_jpype(self, uris, options, stats):
+        from .jpype_backend import decode_uris
+        t0 = perf_counter()
+        try:
+            return decode_uris(self, uris, *options)
+        finally:
+            stats.add(java_time=perf_counter() - t0)
+
+    def decode_parallel(self, filenames, max_workers=None, try_harder=False, possible_formats=None, pure_barcode=False,
+                        products_only=False, batch_size=None, max_cmdline_bytes=None):
+        with DecodeStats(self, 'decode_parallel') as stats:
+            possible_formats = (possible_formats,) if isinstance(possible_formats, str) else possible_formats
+            one_file, file_uris, temp_files = self._prepare(filenames, stats)
+            options = try_harder, possible_formats, pure_barcode, products_only
+
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+
+            codes = []
+            try:
+                lookup = self._lookup(file_uris, options, stats)
+                uris = file_uris if lookup is None else lookup.misses
+
+                # Shard the input evenly across the workers, unless the caller wants smaller batches
+                max_workers = max_workers or os.cpu_count() or 1
+                shard_size = max(1, -(-len(uris) // max_workers))
+                batch_size = min(batch_size, shard_size) if batch_size else shard_size
+                if self.backend == 'jpype':
+                    shards = [uris[ii:ii + batch_size] for ii in range(0, len(uris), batch_size)]
+                    group = None
+                else:
+                    shards = [self._build_cmd(batch, *options)
+                              for batch in self._batches(uris, batch_size, max_cmdline_bytes, *options)]
+                    group = _ProcessGroup()
+
+                with ThreadPoolExecutor(max_workers) as executor:
+                    if group is None:
+                        futures = [executor.submit(self._decode_jpype, shard, options, stats) for shard in shards]
+                    else:
+                        futures = [executor.submit(self._decode_subprocess, shard, group, stats) for shard in shards]
+                    try:
+                        for future in as_completed(futures):
+                            codes += future.result()
+                    except BaseException:
+                        # Don't start any more shards, and stop the ones that are already running
+                        for future in futures:
+                            future.cancel()
+                        if group is not None:
+                            group.stop()
+                        raise
+                if lookup is not None:
+                    codes = lookup.complete(codes)
+            finally:
+                for tf in temp_files:
+                    tf.close()
+
+            stats.barcodes = sum(1 for c in codes if c)
+            return self._reorder(codes, file_uris, one_file)
+
+    def iter_decode(self, filenames, try_harder=False, possible_formats=None, pure_barcode=False, products_only=False,
+                    batch_size=None, max_cmdline_bytes=None, ordered=False, reorder_buffer=None):
+        with DecodeStats(self, 'iter_decode') as stats:
+            possible_formats = (possible_formats,) if isinstance(possible_formats, str) else possible_formats
+            one_file, file_uris, temp_files = self._prepare(filenames, stats)
+            options = try_harder, possible_formats, pure_barcode, products_only
+            if ordered and reorder_buffer:
+                # Never hold more than reorder_buffer results while waiting for an earlier one
+                batch_size = min(batch_size, reorder_buffer) if batch_size else reorder_buffer
+
+            try:
+                lookup = self._lookup(file_uris, options, stats)
+                if lookup is not None:
+                    # Cached results first, then each new result along with any duplicates of the same image
+                    from itertools import chain
+                    codes = chain(lookup.hits, chain.from_iterable(
+                        map(lookup.add, self._iter_uris(lookup.misses, options, batch_size, max_cmdline_bytes, stats))))
+                else:
+                    codes = self._iter_uris(file_uris, options, batch_size, max_cmdline_bytes, stats)
+
+                if not ordered:
+                    for c in codes:
+                        stats.barcodes += bool(c)
+                        yield c
+                else:
+                    # Results are matched to input positions, since the same file may be given more than once
+                    from collections import deque
+                    positions = {}
+                    for ii, uri in enumerate(file_uris):
+                        positions.setdefault(uri, deque()).append(ii)
+                    pending, next_index = {}, 0
+                    for c in codes:
+                        stats.barcodes += bool(c)
+                        indices = positions.get(c.uri)
+                        if indices:
+                            pending[indices.popleft()] = c
+                        while next_index in pending:
+                            yield pending.pop(next_index)
+                            next_index += 1
+                    yield from (pending[ii] for ii in sorted(pending))
+            finally:
+                for tf in temp_files:
+                    tf.close()
+
+    def _iter_uris(self, file_uris, options, batch_size, max_cmdline_bytes, stats):
+        if self.backend == 'jpype':
+            for uri in file_uris:
+                yield from self._decode_jpype([uri], options, stats)
         else:
-            one_file = False
+            for batch in self._batches(file_uris, batch_size, max_cmdline_bytes, *options):
+                yield from self._iter_subprocess(self._build_cmd(batch, *options), stats)
+
+    def _iter_subprocess(self, cmd, stats):
+        # Yields each BarCode as soon as CommandLineRunner has finished printing its block of output
+        cmd, jvm_log = self._add_jvm_log(cmd)
+        t0 = perf_counter()
+        try:
+            p = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.STDOUT, universal_newlines=False)
+        except OSError as e:
+            raise BarCodeReaderException("Could not execute specified Java binary", self.java) from e
+        stats.add(subprocesses=1, launch_time=perf_counter() - t0)
+
+        def parse(data):
+            t = perf_counter()
+            bc = BarCode.parse(data)
+            stats.add(parse_time=perf_counter() - t)
+            return bc
+
+        with p:
+            try:
+                block, errors, nbytes = [], b'', 0
+                parsed_seen, points_left = False, None
+                for line in p.stdout:
+                    nbytes += len(line)
+                    if line.startswith(b'file://'):
+                        if block:
+                            yield parse(b''.join(block))
+                        block, parsed_seen, points_left = [line], False, None
+                        if line.rstrip().endswith(b': No barcode found'):
+                            yield parse(line)
+                            block = []
+                    elif block:
+                        # A block is complete once all of its result points have been printed
+                        block.append(line)
+                        if not parsed_seen:
+                            parsed_seen = line.startswith(b'Parsed result:')
+                        elif points_left is None:
+                            m = _re_found_points.match(line)
+                            if m:
+                                points_left = int(m.group(1))
+                        elif _re_point.match(line):
+                            points_left -= 1
+                        if points_left == 0:
+                            yield parse(b''.join(block))
+                            block = []
+                    elif errors or line.startswith((b'Exception', b'Error: ', b'The operation couldn')):
+                        # Everything from here to the end is error output
+                        errors += line
+                if block:
+                    yield parse(b''.join(block))
+                p.wait()
+                stats.add(java_time=perf_counter() - t0, stdout_bytes=nbytes)
+                self._read_jvm_log(jvm_log, stats)
+                if errors or p.returncode:
+                    self._parse_output(cmd, p.returncode, errors, stats)
+            finally:
+                if p.returncode is None:
+                    p.kill()
+                if jvm_log is not None and os.path.exists(jvm_log):
+                    os.unlink(jvm_log)
+
+    def decode_frames(self, source, every_nth=1, stop_on_first=True, dedupe=True, batch_size=8, try_harder=False,
+                      possible_formats=None, pure_barcode=False, products_only=False, dedupe_threshold=4):
+        '''Looks for barcodes in the frames of a multi-frame image, a video, or an iterable of images, and yields
+           (frame index, BarCode) for each frame in which one is found. Frames are read lazily and decoded in batches
+           of `batch_size`, one Java subprocess per batch.'''
+        from .frames import dhash, iter_frames
+
+        frames = iter_frames(source, every_nth, self.channel_order)
+        try:
+            batch, last_hash, more = [], None, True
+            while more:
+                index, frame = next(frames, (None, None))
+                more = frame is not None
+                if more:
+                    if dedupe:
+                        # Skip frames which look almost the same as the last one we decoded
+                        h = dhash(frame)
+                        if last_hash is not None and bin(h ^ last_hash).count('1') <= dedupe_threshold:
+                            continue
+                        last_hash = h
+                    batch.append((index, frame))
+                    if len(batch) < batch_size:
+                        continue
+                if batch:
+                    codes = self.decode([frame for index, frame in batch], try_harder=try_harder,
+                                        possible_formats=possible_formats, pure_barcode=pure_barcode,
+                                        products_only=products_only)
+                    found = [(index, bc) for (index, frame), bc in zip(batch, codes) if bc]
+                    yield from found
+                    if found and stop_on_first:
+                        return
+                    batch = []
+        finally:
+            frames.close()
+
+    async def decode_async(self, filenames, try_harder=False, possible_formats=None, pure_barcode=False, products_only=False,
+                           batch_size=None, max_cmdline_bytes=None, semaphore=None):
+        import asyncio
+
+        with DecodeStats(self, 'decode_async') as stats:
+            possible_formats = (possible_formats,) if isinstance(possible_formats, str) else possible_formats
+            loop = asyncio.get_running_loop()
+            # Writing temporary files for images and file objects may block, so do it in a thread
+            one_file, file_uris, temp_files = await loop.run_in_executor(None, self._prepare, filenames, stats)
+            options = try_harder, possible_formats, pure_barcode, products_only
+
+            try:
+                lookup = await loop.run_in_executor(None, self._lookup, file_uris, options, stats)
+                uris = file_uris if lookup is None else lookup.misses
+                if self.backend == 'jpype':
+                    async with semaphore or _nullcontext():
+                        codes = await loop.run_in_executor(None, self._decode_jpype, uris, options, stats)
+                else:
+                    codes = []
+                    for batch in self._batches(uris, batch_size, max_cmdline_bytes, *options):
+                        async with semaphore or _nullcontext():
+                            codes += await self._decode_subprocess_async(self._build_cmd(batch, *options), stats)
+                if lookup is not None:
+                    codes = lookup.complete(codes)
+            finally:
+                for tf in temp_files:
+                    tf.close()
+
+            stats.barcodes = sum(1 for c in codes if c)
+            return self._reorder(codes, file_uris, one_file)
+
+    async def _decode_subprocess_async(self, cmd, stats):
+        import asyncio
+
+        cmd, jvm_log = self._add_jvm_log(cmd)
+        t0 = perf_counter()
+        try:
+            p = await asyncio.create_subprocess_exec(*cmd, stdout=sp.PIPE, stderr=sp.STDOUT)
+        except OSError as e:
+            raise BarCodeReaderException("Could not execute specified Java binary", self.java) from e
+        stats.add(subprocesses=1, launch_time=perf_counter() - t0)
+        try:
+            stdout, stderr = await p.communicate()
+        except asyncio.CancelledError:
+            # Don't leave an orphaned JVM behind
+            if p.returncode is None:
+                p.kill()
+                await p.wait()
+            raise
+        finally:
+            if jvm_log is not None:
+                self._read_jvm_log(jvm_log, stats)
+                os.unlink(jvm_log)
+        stats.add(java_time=perf_counter() - t0, stdout_bytes=len(stdout))
+        return self._parse_output(cmd, p.returncode, stdout, stats)
+
+    def _prepare(self, filenames, stats=None):
+        import pathlib
+        from tempfile import NamedTemporaryFile
+
+        t0 = perf_counter()
+        Image, ndarray = _pil_image_class(), _ndarray_class()
+        one_file, filenames = self._split_inputs(filenames)
 
         file_uris = []
         temp_files = []
         for fn_or_im in filenames:
-            if have_pil and isinstance(fn_or_im, Image):
-                tf = NamedTemporaryFile(prefix='PIL_image_', suffix='.png')
+            if ndarray and isinstance(fn_or_im, ndarray):
+                a = _array_to_grayscale(fn_or_im, self.channel_order)
+                tf = NamedTemporaryFile(prefix='array_', suffix='.bmp', dir=_scratch_dir(a.size))
                 temp_files.append(tf)
-                fn_or_im.save(tf, compresslevel=0)
+                _write_gray_bmp(tf, a)
                 tf.flush()
                 fn = tf.name
-            elif isinstance(fn_or_im, IOBase):
-                tf = NamedTemporaryFile(prefix='temp_', suffix=os.path.splitext(getattr(fn_or_im, 'name', ''))[1])
-                temp_files.append(tf)
-                tf.write(fn_or_im.read())
+            elif Image and isinstance(fn_or_im, Image):
+                if fn_or_im.mode in _gray_modes:
+                    # ZXing only looks at luminance, so an 8-bit grayscale BMP is the cheapest format to write and read
+                    im = _to_grayscale(fn_or_im)
+                    tf = NamedTemporaryFile(prefix='PIL_image_', suffix='.bmp', dir=_scratch_dir(im.width * im.height))
+                    temp_files.append(tf)
+                    im.save(tf, format='BMP')
+                else:
+                    tf = NamedTemporaryFile(prefix='PIL_image_', suffix='.png')
+                    temp_files.append(tf)
+                    fn_or_im.save(tf, format='PNG', compresslevel=0)
                 tf.flush()
                 fn = tf.name
+            elif isinstance(fn_or_im, IOBase):
+                fn = _real_file_name(fn_or_im)
+                if fn is None:
+                    tf = NamedTemporaryFile(prefix='temp_', suffix=os.path.splitext(getattr(fn_or_im, 'name', ''))[1])
+                    temp_files.append(tf)
+                    from shutil import copyfileobj
+                    copyfileobj(fn_or_im, tf)
+                    tf.flush()
+                    fn = tf.name
             else:
                 fn = fn_or_im
             file_uris.append(pathlib.Path(fn).absolute().as_uri())
+        if stats is not None:
+            stats.add(images=len(file_uris), temp_files=len(temp_files), materialize_time=perf_counter() - t0)
+        return one_file, file_uris, temp_files
+
+    @staticmethod
+    def _split_inputs(filenames):
+        # Returns (one_file, sequence of inputs)
+        Image, ndarray = _pil_image_class(), _ndarray_class()
+        if ndarray and isinstance(filenames, ndarray):
+            # A single image, or a stack of them
+            if _is_single_image_array(filenames):
+                return True, (filenames,)
+            return False, filenames
+        elif isinstance(filenames, (str, IOBase, Image) if Image else (str, IOBase)):
+            return True, (filenames,)
+        return False, filenames
+
+    @staticmethod
+    def _reorder(codes, file_uris, one_file):
+        if one_file:
+            return codes[0]
+        else:
+            # zxing (insanely) randomly reorders the output blocks, so we have to put them back in the
+            # expected order, based on their URIs
+            d = {c.uri: c for c in codes}
+            return [d[f] for f in file_uris]
+
+    @staticmethod
+    def _default_max_cmdline_bytes():
+        if os.name == 'nt':
+            return 32000  # CreateProcess() limits the whole command line to 32767 characters
+        try:
+            arg_max = os.sysconf('SC_ARG_MAX')
+        except (AttributeError, ValueError, OSError):
+            arg_max = 131072
+        # The environment shares the same space as the arguments; leave plenty of slack
+        env_bytes = sum(len(k) + len(v) + 2 for k, v in os.environ.items())
+        return max(arg_max // 2 - env_bytes, 4096)
+
+    def _batches(self, file_uris, batch_size, max_cmdline_bytes, *options):
+        # Split the URIs into groups small enough for a single CommandLineRunner invocation
+        if max_cmdline_bytes is None:
+            max_cmdline_bytes = self._default_max_cmdline_bytes()
+        base_bytes = sum(len(os.fsencode(arg)) + 1 for arg in self._build_cmd([], *options))
+        batch, batch_bytes = [], base_bytes
+        for uri in file_uris:
+            if batch and (len(batch) == batch_size or batch_bytes + len(uri) + 1 > max_cmdline_bytes):
+                yield batch
+                batch, batch_bytes = [], base_bytes
+            batch.append(uri)
+            batch_bytes += len(uri) + 1
+        if batch:
+            yield batch
 
-        cmd = [self.java, '-Djava.awt.headless=true', '-cp', self.classpath, self.cls] + file_uris
+    def _build_cmd(self, file_uris, try_harder, possible_formats, pure_barcode, products_only, multi=False):
+        if self._jvm_args is None:
+            self._jvm_args = list(self.jvm_options)
+            if self.cds_archive:
+                from .cds import cds_options
+                self._jvm_args += cds_options(self)
+        cmd = [self.java] + self._jvm_args + ['-Djava.awt.headless=true', '-cp', self.classpath, self.cls] + file_uris
         if self.zxing_version_info and self.zxing_version_info >= (3, 5, 3):
             # The --raw option was added in 3.5.0, but broken for certain barcode types (PDF_417 and maybe others) until 3.5.3
             # See https://github.com/zxing/zxing/issues/1682 and https://github.com/zxing/zxing/issues/1683
@@ -123,61 +998,142 @@ class BarCodeReader(object):
             cmd.append('--pure_barcode')
         if products_only:
             cmd.append('--products_only')
+        if multi:
+            cmd.append('--multi')
         if possible_formats:
             for pf in possible_formats:
                 cmd += ['--possible_formats', pf]
+        return cmd
 
+    def _add_jvm_log(self, cmd):
+        # With jvm_timings, have the JVM log the time taken by each phase of its startup to a temporary file
+        if not self.jvm_timings or self.backend != 'subprocess':
+            return cmd, None
+        if self._jvm_major_version is None:
+            from .cds import java_major_version, java_version
+            self._jvm_major_version = java_major_version(java_version(self.java)) or 0
+        if self._jvm_major_version < 9:
+            return cmd, None  # No -Xlog before Java 9
+        from tempfile import mkstemp
+        fd, jvm_log = mkstemp(prefix='zxing_jvm_', suffix='.log')
+        os.close(fd)
+        return cmd[:1] + ['-Xlog:startuptime:file="%s":none:filecount=0' % jvm_log] + cmd[1:], jvm_log
+
+    @staticmethod
+    def _read_jvm_log(jvm_log, stats):
+        if jvm_log is not None and stats is not None:
+            try:
+                with open(jvm_log, 'rb') as f:
+                    stats.add_jvm_log(f.read())
+            except OSError:
+                pass
+
+    def _decode_subprocess(self, cmd, group=None, stats=None, partial=False):
+        cmd, jvm_log = self._add_jvm_log(cmd)
+        t0 = perf_counter()
         try:
-            p = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.STDOUT, universal_newlines=False)
+            if group is None:
+                p = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.STDOUT, universal_newlines=False)
+            else:
+                p = group.popen(cmd, stdout=sp.PIPE, stderr=sp.STDOUT, universal_newlines=False)
         except OSError as e:
             raise BarCodeReaderException("Could not execute specified Java binary", self.java) from e
         else:
-            stdout, stderr = p.communicate()
-        finally:
-            for tf in temp_files:
-                tf.close()
+            t1 = perf_counter()
+            try:
+                stdout, stderr = p.communicate()
+            finally:
+                if group is not None:
+                    group.discard(p)
+                if jvm_log is not None:
+                    self._read_jvm_log(jvm_log, stats)
+                    os.unlink(jvm_log)
+        if stats is not None:
+            stats.add(subprocesses=1, launch_time=t1 - t0, java_time=perf_counter() - t0, stdout_bytes=len(stdout))
+        return self._parse_output(cmd, p.returncode, stdout, stats, partial)
+
+    def _parse_output(self, cmd, returncode, stdout, stats=None, partial=False):
+        # CommandLineRunner gives up at the first image it can't read, after printing the results for those before it.
+        # With partial=True, return (those results, the exception) rather than raising it.
+        i = _find_line(stdout, b'Exception in thread "main" ', 0, len(stdout))
+        output, error = (stdout, None) if i < 0 else (stdout[:i], stdout[i:])
+        try:
+            self._check_output(cmd, returncode, stdout if error is None else error)
+        except BarCodeReaderException as e:
+            if not partial:
+                raise
+            error = e
+        else:
+            error = None
 
+        t0 = perf_counter()
+        codes = BarCode.parse_all(output)
+        if stats is not None:
+            stats.add(parse_time=perf_counter() - t0)
+        return (codes, error) if partial else codes
+
+    def _check_output(self, cmd, returncode, stdout):
         if stdout.startswith((b'Error: Could not find or load main class com.google.zxing.client.j2se.CommandLineRunner',
                               b'Exception in thread "main" java.lang.NoClassDefFoundError:')):
             raise BarCodeReaderException("Java JARs not found in classpath (%s)" % self.classpath, self.classpath)
         elif stdout.startswith((b'''Exception in thread "main" javax.imageio.IIOException: Can't get input stream from URL!''',
                                 b'''Exception in thread "main" java.util.concurrent.ExecutionException: javax.imageio.IIOException: Can't get input stream from URL!''')):  # noqa: E501
-            # Find the line that looks like: "Caused by: java.io.FileNotFoundException: $FILENAME ({No such file or directory,Permission denied,*)"
-            fn, err = next((map(bytes.decode, l[42:].rsplit(b' (', 1)) for l in stdout.splitlines()
-                            if l.startswith(b"Caused by: java.io.FileNotFoundException: ")), ('', ''))
-            if err == 'No such file or directory)':
-                err = FileNotFoundError(fn)
-            elif err == 'Permission denied)':
-                err = PermissionError(fn)
-            else:
-                err = OSError(err[:-1])
+            # Find the line that looks like: "Caused by: java.io.FileNotFoundException: $FILENAME (...)"
+            fn, err = _file_not_found_error(next((l[42:].decode() for l in stdout.splitlines()
+                                                  if l.startswith(b"Caused by: java.io.FileNotFoundException: ")), ''))
             raise BarCodeReaderException("Java library could not read image", fn) from err
         elif stdout.startswith(b'''Exception in thread "main" java.io.IOException: Could not load '''):
             # First line ends with file:// URI
             fn = file_uri_to_path(stdout.splitlines()[0][63:].decode())
             raise BarCodeReaderException("Java library could not read image (is it in a supported format?)", fn)
+        elif stdout.startswith(b'''Exception in thread "main" javax.imageio.IIOException: ''') and (
+                b'at com.google.zxing.client.j2se.ImageReader.readImage(' in stdout):
+            # A corrupt or truncated image, which Java doesn't name
+            raise BarCodeReaderException("Java library could not read image (is it corrupt?)") from sp.CalledProcessError(
+                returncode, cmd, stdout)
         elif stdout.startswith(b'''Exception '''):
             raise BarCodeReaderException("Unknown Java exception", self.java) from sp.CalledProcessError(0, cmd, stdout)
         elif stdout.startswith(b'''The operation couldn't be completed. Unable to locate a Java Runtime.'''):
-            raise BarCodeReaderException("Unable to locate Java runtime (check JAVA_HOME variable and other configuration)", self.java) from sp.CalledProcessError(p.returncode, cmd, stdout)
-        elif p.returncode:
-            raise BarCodeReaderException("Unexpected Java subprocess return code", self.java) from sp.CalledProcessError(p.returncode, cmd, stdout)
-
-        file_results = []
-        for line in stdout.splitlines(True):
-            if line.startswith((b'file://', b'Exception')):
-                file_results.append(line)
-            else:
-                file_results[-1] += line
-        codes = [BarCode.parse(result) for result in file_results]
+            raise BarCodeReaderException("Unable to locate Java runtime (check JAVA_HOME variable and other configuration)", self.java) from sp.CalledProcessError(returncode, cmd, stdout)
+        elif returncode:
+            raise BarCodeReaderException("Unexpected Java subprocess return code", self.java) from sp.CalledProcessError(returncode, cmd, stdout)
 
-        if one_file:
-            return codes[0]
-        else:
-            # zxing (insanely) randomly reorders the output blocks, so we have to put them back in the
-            # expected order, based on their URIs
-            d = {c.uri: c for c in codes}
-            return [d[f] for f in file_uris]
+
+class _nullcontext(object):
+    # Like contextlib.nullcontext, but usable with "async with" in Python <3.10
+
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class _ProcessGroup(object):
+    # Tracks concurrently-running Java subprocesses, so that they can all be stopped at once
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.procs = set()
+        self.stopped = False
+
+    def popen(self, cmd, **kwargs):
+        with self.lock:
+            if self.stopped:
+                raise BarCodeReaderException("Decoding was stopped")
+            p = sp.Popen(cmd, **kwargs)
+            self.procs.add(p)
+            return p
+
+    def discard(self, p):
+        with self.lock:
+            self.procs.discard(p)
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            for p in self.procs:
+                p.kill()
 
 
 class CLROutputBlock(Enum):
@@ -188,49 +1144,145 @@ class CLROutputBlock(Enum):
     RAW_BITS = 4
 
 
+_re_found_points = re.compile(rb"Found\s+(\d+)\s+result\s+points?")
+_re_point = re.compile(rb"\s*Point\s*\d+:\s*\((-?[\d.]+),(-?[\d.]+)\)")
+
+_re_header = re.compile(rb"(\S+) \(format:\s*([^,]+),\s*type:\s*([^)]+)\)")
+_re_found_line = re.compile(rb"Found[ \t\x0b\x0c]+\d+[ \t\x0b\x0c]+result[ \t\x0b\x0c]+points?")
+_re_eol = re.compile(rb"\r\n?|\n")
+
+
+def _find_line(data, prefix, pos, end):
+    # Index of the first line in data[pos:end] which starts with prefix (pos must be the start of a line), or -1.
+    # Lines end with \n, \r\n, or a lone \r, as with bytes.splitlines().
+    i = data.find(prefix, pos, end)
+    while i > pos and data[i - 1] not in b'\r\n':
+        i = data.find(prefix, i + 1, end)
+    return i
+
+
+def _find_found_points(data, pos, end):
+    # Index of the first "Found N result points" line in data[pos:end], or -1
+    i = _find_line(data, b'Found', pos, end)
+    while i >= 0 and not _re_found_line.match(data, i, end):
+        i = _find_line(data, b'Found', i + 1, end)
+    return i
+
+
+def _next_line(data, pos, end):
+    # Index of the start of the line after the one containing pos
+    m = _re_eol.search(data, pos, end)
+    return m.end() if m else end
+
+
+class BarCodes(list):
+    '''The barcodes found in one image by decode(multi=True): a list of BarCode objects, along with the image's URI.
+       Like a BarCode, it is False-y if no barcode was found.'''
+    __slots__ = ('uri',)
+
+    def __init__(self, uri, barcodes=()):
+        super().__init__(barcodes)
+        self.uri = uri
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['uri'], [BarCode.from_dict(bc) for bc in d['barcodes']])
+
+    def to_dict(self):
+        return dict(uri=self.uri, barcodes=[bc.to_dict() for bc in self])
+
+    def _with_uri(self, uri):
+        return self.__class__(uri, [bc._with_uri(uri) for bc in self])
+
+    @property
+    def path(self):
+        try:
+            return file_uri_to_path(self.uri)
+        except ValueError:
+            pass
+
+    def __repr__(self):
+        return '{}(path={!r}, {})'.format(self.__class__.__name__, self.path, list.__repr__(self))
+
+
 class BarCode(object):
+    __slots__ = ('raw', 'parsed', 'raw_bits', 'uri', 'format', 'type', 'points', 'decode_pass')
+
     @classmethod
     def parse(cls, zxing_output):
-        block = CLROutputBlock.UNKNOWN
+        return cls._parse_block(zxing_output, 0, len(zxing_output))
+
+    @classmethod
+    def parse_all(cls, zxing_output):
+        # Each block of CommandLineRunner output begins with a line starting with its file:// URI
+        # (or with an exception)
+        starts, end = [], len(zxing_output)
+        for prefix in (b'file://', b'Exception'):
+            i = _find_line(zxing_output, prefix, 0, end)
+            while i >= 0:
+                starts.append(i)
+                i = _find_line(zxing_output, prefix, i + 1, end)
+        starts.sort()
+        return [cls._parse_block(zxing_output, start, stop) for start, stop in zip(starts, starts[1:] + [end])]
+
+    @classmethod
+    def _parse_block(cls, data, start, end):
+        # A block looks like "URI (format: F, type: T):", "Raw result:", raw text, "Parsed result:", parsed text,
+        # optionally "Raw bits:" and hex, "Found N result points.", and "  Point i: (x,y)" lines. The (potentially
+        # large) text sections are found by searching data[start:end] in place, and only copied out once.
+        raw_start = _find_line(data, b'Raw result:', start, end)
         uri = format = type = None
+        for l in data[start:end if raw_start < 0 else _next_line(data, raw_start, end)].splitlines(True):
+            if l.strip().endswith(b': No barcode found'):
+                return cls(l.rsplit(b':', 1)[0].decode(), None, None, None, None, None)
+            m = _re_header.match(l)
+            if m:
+                uri, format, type = m.group(1).decode(), m.group(2).decode(), m.group(3).decode()
+
         raw = parsed = raw_bits = b''
         points = []
-
-        for l in zxing_output.splitlines(True):
-            if block == CLROutputBlock.UNKNOWN:
-                if l.strip().endswith(b': No barcode found'):
-                    return cls(l.rsplit(b':', 1)[0].decode(), None, None, None, None, None)
-                m = re.match(rb"(\S+) \(format:\s*([^,]+),\s*type:\s*([^)]+)\)", l)
-                if m:
-                    uri, format, type = m.group(1).decode(), m.group(2).decode(), m.group(3).decode()
-                elif l.startswith(b"Raw result:"):
-                    block = CLROutputBlock.RAW
-            elif block == CLROutputBlock.RAW:
-                if l.startswith(b"Parsed result:"):
-                    block = CLROutputBlock.PARSED
-                else:
-                    raw += l
-            elif block == CLROutputBlock.PARSED:
-                if l.startswith(b"Raw bits:"):
-                    block = CLROutputBlock.RAW_BITS
-                elif re.match(rb"Found\s+\d+\s+result\s+points?", l):
-                    block = CLROutputBlock.POINTS
-                else:
-                    parsed += l
-            elif block == CLROutputBlock.RAW_BITS:
-                if re.match(rb"Found\s+\d+\s+result\s+points?", l):
-                    block = CLROutputBlock.POINTS
-                else:
-                    raw_bits += l
-            elif block == CLROutputBlock.POINTS:
-                m = re.match(rb"\s*Point\s*\d+:\s*\(([\d.]+),([\d.]+)\)", l)
+        i = raw_start
+        if i >= 0:
+            i = _find_line(data, b'Parsed result:', _next_line(data, i, end), end)
+            raw = data[_next_line(data, raw_start, end):(end if i < 0 else i) - 1]
+        if i >= 0:
+            parsed_start = _next_line(data, i, end)
+            bits, i = _find_line(data, b'Raw bits:', parsed_start, end), _find_found_points(data, parsed_start, end)
+            if 0 <= bits and (i < 0 or bits < i):
+                parsed = data[parsed_start:bits - 1]
+                bits_start = _next_line(data, bits, end)
+                i = _find_found_points(data, bits_start, end)
+                raw_bits = data[bits_start:(end if i < 0 else i) - 1]
+            else:
+                parsed = data[parsed_start:(end if i < 0 else i) - 1]
+        if i >= 0:
+            for l in data[_next_line(data, i, end):end].splitlines():
+                m = _re_point.match(l)
                 if m:
                     points.append((float(m.group(1)), float(m.group(2))))
 
-        parsed = parsed[:-1].decode()
-        raw = raw[:-1].decode()
-        raw_bits = bytes.fromhex(raw_bits[:-1].decode())
-        return cls(uri, format, type, raw, parsed, raw_bits, points)
+        return cls(uri, format, type, raw.decode(), parsed.decode(), bytes.fromhex(raw_bits.decode()), points)
+
+    @classmethod
+    def from_dict(cls, d):
+        bc = cls(d['uri'], d['format'], d['type'], d['raw'], d['parsed'],
+                 None if d['raw_bits'] is None else bytes.fromhex(d['raw_bits']),
+                 None if d['points'] is None else [tuple(p) for p in d['points']])
+        bc.decode_pass = d.get('decode_pass')
+        return bc
+
+    def to_dict(self):
+        # JSON-serializable representation
+        d = dict(uri=self.uri, format=self.format, type=self.type, raw=self.raw, parsed=self.parsed,
+                 raw_bits=None if self.raw_bits is None else self.raw_bits.hex(),
+                 points=None if self.points is None else [list(p) for p in self.points])
+        if self.decode_pass is not None:
+            d['decode_pass'] = self.decode_pass
+        return d
+
+    def _with_uri(self, uri):
+        return self.__class__(uri, self.format, self.type, self.raw, self.parsed, self.raw_bits,
+                              None if self.points is None else list(self.points))
 
     def __bool__(self):
         return bool(self.raw)
@@ -243,6 +1295,7 @@ class BarCode(object):
         self.format = format
         self.type = type
         self.points = points
+        self.decode_pass = None  # Set by decode(strategy=...) to the name of the pass which produced this result
 
     @property
     def path(self):
@@ -256,3 +1309,11 @@ class BarCode(object):
             self.__class__.__name__, self.raw, self.parsed, self.raw_bits.hex() if self.raw_bits else None,
             'path' if self.path else 'uri', self.path or self.uri,
             self.format, self.type, self.points)
+
+
+def __getattr__(name):
+    # Import zxing.cache only when zxing.ResultCache is first used
+    if name == 'ResultCache':
+        from .cache import ResultCache
+        return ResultCache
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -1,8 +1,14 @@
 import argparse
 import csv
+import json
+import threading
+from io import BytesIO
+from queue import Queue
+import sys
 from sys import stdout, stdin
 
 from . import BarCodeReader, BarCodeReaderException, data_uri_to_fobj
+from .manifest import decode_manifest, describe_error
 from .version import __version__
 
 
@@ -19,16 +25,167 @@ class ErrorDeferredArgumentParser(argparse.ArgumentParser):
             super().error(e)
 
 
-def main():
-    p = ErrorDeferredArgumentParser()
-    p.add_argument('-c', '--csv', action='store_true')
+def _missing_result(fn):
+    return BarCodeReaderException("No result from Java library", fn)
+
+
+def _decode_items(bcr, items, **options):
+    # Yields (index, BarCode or BarCodeReaderException) for each (index, name, image) item. All the images are decoded
+    # by a single JVM (or as few as the command-line length allows), unless that fails; in that case, the rest are
+    # decoded with errors='return', so that the error can be reported for the file(s) which caused it.
+    done = 0
+    try:
+        for bc, (ii, fn, ff) in zip(bcr.iter_decode([ff for ii, fn, ff in items], ordered=True, **options), items):
+            yield ii, bc
+            done += 1
+        # Every item must get a result, even if Java somehow didn't report one
+        for ii, fn, ff in items[done:]:
+            yield ii, _missing_result(fn)
+    except BarCodeReaderException:
+        rest = items[done:]
+        for ii, fn, ff in rest:
+            if isinstance(ff, BytesIO):
+                ff.seek(0)
+        try:
+            yield from zip((ii for ii, fn, ff in rest), bcr.decode([ff for ii, fn, ff in rest], errors='return', **options))
+        except BarCodeReaderException as e:
+            yield from ((ii, e) for ii, fn, ff in rest)
+
+
+def _decode_in_parallel(bcr, items, jobs, **options):
+    # Like _decode_items, but with the items split into `jobs` shards, each decoded by its own JVM(s) in a thread.
+    # Results are yielded in the order they're completed.
+    q = Queue()
+
+    def worker(shard):
+        try:
+            for r in _decode_items(bcr, shard, **options):
+                q.put(r)
+        except BaseException as e:
+            q.put(e)
+        finally:
+            q.put(None)
+
+    shard_size = -(-len(items) // jobs)
+    shards = [items[ii:ii + shard_size] for ii in range(0, len(items), shard_size)]
+    for shard in shards:
+        threading.Thread(target=worker, args=(shard,), daemon=True).start()
+    running = len(shards)
+    while running:
+        r = q.get()
+        if r is None:
+            running -= 1
+        elif isinstance(r, BaseException):
+            raise r
+        else:
+            yield r
+
+
+def _add_decode_options(p):
     p.add_argument('--try-harder', action='store_true')
     p.add_argument('--pure-barcode', action='store_true')
-    p.add_argument('image', nargs='+', help='File path or data: URI of an image containing a barcode')
+    p.add_argument('--products-only', action='store_true', help='Only look for UPC and EAN barcodes')
+    p.add_argument('--possible-formats', action='append', metavar='FORMAT[,FORMAT...]',
+                   help='Only look for barcodes in these formats (e.g. QR_CODE,DATA_MATRIX)')
     p.add_argument('-P', '--classpath', help=argparse.SUPPRESS)
     p.add_argument('-J', '--java', help=argparse.SUPPRESS)
+
+
+def _decode_options(args):
+    return dict(try_harder=args.try_harder, pure_barcode=args.pure_barcode, products_only=args.products_only,
+                possible_formats=[f for fs in args.possible_formats for f in fs.split(',')] if args.possible_formats else None)
+
+
+def watch_main(argv):
+    from .watch import HotFolder
+
+    p = argparse.ArgumentParser(prog='zxing watch', description='Decode the images which appear in a directory, moving '
+                                'each one into a subdirectory for done or failed files, with its result in FILE.json')
+    p.add_argument('directory')
+    p.add_argument('--done', metavar='DIR', help='Where to move images in which a barcode was found (default: DIRECTORY/done)')
+    p.add_argument('--failed', metavar='DIR', help='Where to move the other images (default: DIRECTORY/failed)')
+    p.add_argument('--max-batch', type=int, default=50, help='Maximum number of images per Java process (default: %(default)s)')
+    p.add_argument('--max-wait', type=float, default=0.2,
+                   help='Maximum time to wait for more images before decoding a batch, in seconds (default: %(default)s)')
+    p.add_argument('--poll', action='store_true', help="Poll the directory, even if inotify is available")
+    p.add_argument('--poll-interval', type=float, default=0.5, help='In seconds (default: %(default)s)')
+    _add_decode_options(p)
+    args = p.parse_args(argv)
+
+    def on_result(path, new_path, bc):
+        d = dict(filename=path, moved_to=new_path)
+        if isinstance(bc, BarCodeReaderException):
+            d['error'] = describe_error(bc)
+        else:
+            d.update(bc.to_dict())
+        print(json.dumps(d), flush=True)
+
+    hf = HotFolder(BarCodeReader(args.classpath, args.java), args.directory, done_dir=args.done, failed_dir=args.failed,
+                   max_batch=args.max_batch, max_wait=args.max_wait, poll_interval=args.poll_interval,
+                   inotify=False if args.poll else None, on_result=on_result, **_decode_options(args))
+    try:
+        hf.run()
+    except KeyboardInterrupt:
+        hf.stop()
+
+
+def serve_main(argv):
+    from .serve import DecodeServer
+
+    p = argparse.ArgumentParser(prog='zxing serve', description='Decode images POSTed to http://HOST:PORT/decode')
+    p.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: %(default)s)')
+    p.add_argument('-p', '--port', type=int, default=8080, help='(default: %(default)s)')
+    p.add_argument('--max-batch', type=int, default=50, help='Maximum number of images per Java process (default: %(default)s)')
+    p.add_argument('--max-wait', type=float, default=0.05,
+                   help='Maximum time to wait for more images before decoding a batch, in seconds (default: %(default)s)')
+    p.add_argument('--max-queue', type=int, default=256,
+                   help='Maximum number of images waiting to be decoded, beyond which requests get 503 (default: %(default)s)')
+    _add_decode_options(p)
+    args = p.parse_args(argv)
+
+    server = DecodeServer(BarCodeReader(args.classpath, args.java), args.host, args.port, max_batch=args.max_batch,
+                          max_wait=args.max_wait, max_queue=args.max_queue, **_decode_options(args))
+    print('Listening on http://%s:%d' % server.address[:2], file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['watch']:
+        return watch_main(argv[1:])
+    elif argv[:1] == ['serve']:
+        return serve_main(argv[1:])
+
+    p = ErrorDeferredArgumentParser()
+    g = p.add_mutually_exclusive_group()
+    g.add_argument('-c', '--csv', action='store_true')
+    g.add_argument('--jsonl', action='store_true',
+                   help='Output each result as a line of JSON, as soon as it is decoded (not necessarily in order)')
+    _add_decode_options(p)
+    p.add_argument('-j', '--jobs', type=int, default=1, help='Number of Java processes to run in parallel (default: %(default)s)')
+    p.add_argument('image', nargs='*', help='File path or data: URI of an image containing a barcode, or - for stdin')
+    g = p.add_argument_group('Manifest mode', 'Decode a (possibly huge) list of images, in batches')
+    g.add_argument('-m', '--manifest', metavar='FILE',
+                   help='Read paths or data: URIs of images from FILE (- for stdin), one per line')
+    g.add_argument('-0', '--null', action='store_true', help='Manifest entries are separated by NUL characters, not newlines')
+    g.add_argument('-o', '--output', metavar='FILE', help='Write results to FILE, rather than stdout')
+    g.add_argument('--checkpoint', metavar='FILE',
+                   help='Save progress to FILE after each batch; if it already exists, resume from where it left off')
+    g.add_argument('--batch-size', type=int, default=100, help='Number of images per Java process (default: %(default)s)')
     p.add_argument('-V', '--version', action='store_true')
-    args = p.parse_args()
+    args = p.parse_args(argv)
+    if not (args.image or args.manifest):
+        p.error('the following arguments are required: image (or --manifest)')
+    elif args.image and args.manifest:
+        p.error('image arguments cannot be combined with --manifest')
+    elif (args.output or args.checkpoint or args.null) and not args.manifest:
+        p.error('--output, --checkpoint and --null require --manifest')
+    elif args.checkpoint and not args.output:
+        p.error('--checkpoint requires --output')
     if p._errors and not args.version:
         p.handle_errors()
 
@@ -38,34 +195,56 @@ def main():
         p.exit(0, '%s v%s\n'
                   'using Java ZXing library version v%s\n' % (p.prog, __version__, bcr.zxing_version))
 
-    if args.csv:
-        wr = csv.writer(stdout)
-        wr.writerow(('Filename', 'Format', 'Type', 'Raw', 'Parsed'))
+    options = _decode_options(args)
+
+    if args.manifest:
+        counts = decode_manifest(bcr, stdin.buffer if args.manifest == '-' else args.manifest, args.output or stdout.buffer,
+                                 checkpoint=args.checkpoint, format='csv' if args.csv else 'jsonl',
+                                 delimiter='\0' if args.null else '\n', batch_size=args.batch_size, jobs=args.jobs, **options)
+        p.exit(1 if counts['errors'] else 0)
 
-    for fn in args.image:
+    # Collect all the images first, so that they can be decoded together
+    results = {}
+    items = []
+    for ii, fn in enumerate(args.image):
         if fn == '-':
-            ff = stdin.buffer
-            fn = ff.name
+            # Read it into memory now, in case it has to be decoded again after an error
+            ff = BytesIO(stdin.buffer.read())
+            ff.name = fn = stdin.buffer.name
         elif ':' in fn:
             try:
                 ff = data_uri_to_fobj(fn)
                 fn = ff.name
             except ValueError as exc:
-                p.error(exc.args[0])
+                results[ii] = BarCodeReaderException(exc.args[0])
+                ff = None
         else:
             ff = fn
+        items.append((ii, fn, ff))
+    names = [fn for ii, fn, ff in items]
 
-        bc = None
-        try:
-            bc = bcr.decode(ff, try_harder=args.try_harder, pure_barcode=args.pure_barcode)
-        except BarCodeReaderException as e:
-            p.error(e.message + ((': ' + e.filename) if e.filename else '') + (('\n\tCaused by: ' + repr(e.__cause__) if e.__cause__ else '')))
+    todo = [item for item in items if item[0] not in results]
+    if args.jobs > 1 and len(todo) > 1:
+        decoded = _decode_in_parallel(bcr, todo, min(args.jobs, len(todo)), **options)
+    else:
+        decoded = _decode_items(bcr, todo, **options)
+
+    if args.csv:
+        wr = csv.writer(stdout)
+        wr.writerow(('Filename', 'Format', 'Type', 'Raw', 'Parsed'))
 
-        if args.csv:
-            wr.writerow((fn, bc.format, bc.type, bc.raw, bc.parsed) if bc else (fn, 'ERROR', None, None, None))
+    def output(ii, bc):
+        fn, error = names[ii], isinstance(bc, BarCodeReaderException)
+        if args.jsonl:
+            print(json.dumps(dict(filename=fn, error=describe_error(bc)) if error else dict(filename=fn, **bc.to_dict())),
+                  flush=True)
+        elif args.csv:
+            wr.writerow((fn, bc.format, bc.type, bc.raw, bc.parsed) if bc and not error else (fn, 'ERROR', None, None, None))
         else:
             print("%s\n%s" % (fn, '=' * len(fn)))
-            if not bc:
+            if error:
+                print("  ERROR: %s\n" % describe_error(bc))
+            elif not bc:
                 print("  ERROR: Failed to decode barcode (using Java ZXing library v%s)." % bcr.zxing_version)
             else:
                 print("  Decoded %s barcode in %s format." % (bc.type, bc.format))
@@ -73,6 +252,27 @@ def main():
                 print("  Parsed text: %r" % bc.parsed)
                 print("  Raw bits:    %r\n" % bc.raw_bits.hex())
 
+    if args.jsonl:
+        # Output results as soon as they're decoded
+        for ii in sorted(results):
+            output(ii, results[ii])
+        for ii, bc in decoded:
+            results[ii] = bc
+            output(ii, bc)
+    else:
+        # Output results in the same order as the arguments
+        next_ii = 0
+        for ii, bc in decoded:
+            results[ii] = bc
+            while next_ii in results:
+                output(next_ii, results[next_ii])
+                next_ii += 1
+        for ii in range(next_ii, len(items)):
+            output(ii, results.setdefault(ii, _missing_result(names[ii])))
+
+    if any(isinstance(bc, BarCodeReaderException) for bc in results.values()):
+        p.exit(1)
+
 
 if __name__=='__main__':
     main()
@@ -0,0 +1,403 @@
+########################################################################
+#
+#  Benchmarks for python-zxing
+#
+#  Run with: python -m zxing.bench [BENCHMARK] [options]
+#
+
+import argparse
+import glob
+import os
+import sys
+import time
+from tempfile import NamedTemporaryFile
+
+from . import BarCodeReader
+
+default_image_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test', 'barcodes')
+
+
+def find_images(image_dir=None):
+    filenames = sorted(fn for fn in glob.glob(os.path.join(image_dir or default_image_dir, '*'))
+                       if not os.path.basename(fn).startswith('bad_'))
+    if not filenames:
+        raise SystemExit("No images found in %s" % (image_dir or default_image_dir))
+    return filenames
+
+
+def bench_parallel(reader, filenames, workers=(1, 2, 4, 8), repeat=8):
+    '''Decode the images (repeated `repeat` times) with decode_parallel() using different numbers of workers,
+       and report the throughput for each.'''
+    filenames = filenames * repeat
+    results = []
+    for n in workers:
+        t0 = time.perf_counter()
+        reader.decode_parallel(filenames, max_workers=n)
+        elapsed = time.perf_counter() - t0
+        results.append(dict(workers=n, images=len(filenames), seconds=elapsed, images_per_second=len(filenames) / elapsed))
+    return results
+
+
+def bench_startup(reader, repeat=20):
+    '''Time "import zxing" in a fresh Python interpreter (less the time for the interpreter to start up on its own),
+       and BarCodeReader construction with and without the process-wide classpath cache.'''
+    import subprocess
+    import sys
+
+    def _time_python(code):
+        t0 = time.perf_counter()
+        for ii in range(repeat):
+            subprocess.check_call([sys.executable, '-c', code])
+        return (time.perf_counter() - t0) / repeat
+
+    def _time_constructor(clear_cache, **kwargs):
+        t0 = time.perf_counter()
+        for ii in range(repeat):
+            if clear_cache:
+                BarCodeReader._classpath_cache.clear()
+            BarCodeReader(reader.classpath, reader.java, **kwargs)
+        return (time.perf_counter() - t0) / repeat
+
+    return [dict(what='import zxing', ms=(_time_python('import zxing') - _time_python('pass')) * 1000),
+            dict(what='BarCodeReader() uncached', ms=_time_constructor(True) * 1000),
+            dict(what='BarCodeReader() cached', ms=_time_constructor(False) * 1000),
+            dict(what='BarCodeReader(zxing_version=...)', ms=_time_constructor(False, zxing_version=reader.zxing_version) * 1000)]
+
+
+def bench_jvm(reader, filenames, repeat=10):
+    '''Time a decode() of a single image with the default JVM, with an AppCDS archive, and with an AppCDS archive
+       plus the C1 compiler only and the serial garbage collector.'''
+    configs = (('default', {}),
+               ('cds', dict(cds_archive='auto')),
+               ('cds+c1+serialgc', dict(cds_archive='auto', jvm_options=['-XX:TieredStopAtLevel=1', '-XX:+UseSerialGC'])))
+    results = []
+    for name, kwargs in configs:
+        r = BarCodeReader(reader.classpath, reader.java, **kwargs)
+        r.decode(filenames[0])  # builds the archive, if needed
+        times = []
+        for ii in range(repeat):
+            t0 = time.perf_counter()
+            r.decode(filenames[0])
+            times.append(time.perf_counter() - t0)
+        times.sort()
+        results.append(dict(config=name, min_ms=times[0] * 1000, median_ms=times[len(times) // 2] * 1000))
+    return results
+
+
+def _legacy_parse(stdout):
+    # How decode() used to parse CommandLineRunner output, for comparison
+    import re
+    from . import BarCode, CLROutputBlock
+
+    def parse(zxing_output):
+        block = CLROutputBlock.UNKNOWN
+        uri = format = type = None
+        raw = parsed = raw_bits = b''
+        points = []
+
+        for l in zxing_output.splitlines(True):
+            if block == CLROutputBlock.UNKNOWN:
+                if l.strip().endswith(b': No barcode found'):
+                    return BarCode(l.rsplit(b':', 1)[0].decode(), None, None, None, None, None)
+                m = re.match(rb"(\S+) \(format:\s*([^,]+),\s*type:\s*([^)]+)\)", l)
+                if m:
+                    uri, format, type = m.group(1).decode(), m.group(2).decode(), m.group(3).decode()
+                elif l.startswith(b"Raw result:"):
+                    block = CLROutputBlock.RAW
+            elif block == CLROutputBlock.RAW:
+                if l.startswith(b"Parsed result:"):
+                    block = CLROutputBlock.PARSED
+                else:
+                    raw += l
+            elif block == CLROutputBlock.PARSED:
+                if l.startswith(b"Raw bits:"):
+                    block = CLROutputBlock.RAW_BITS
+                elif re.match(rb"Found\s+\d+\s+result\s+points?", l):
+                    block = CLROutputBlock.POINTS
+                else:
+                    parsed += l
+            elif block == CLROutputBlock.RAW_BITS:
+                if re.match(rb"Found\s+\d+\s+result\s+points?", l):
+                    block = CLROutputBlock.POINTS
+                else:
+                    raw_bits += l
+            elif block == CLROutputBlock.POINTS:
+                m = re.match(rb"\s*Point\s*\d+:\s*\((-?[\d.]+),(-?[\d.]+)\)", l)
+                if m:
+                    points.append((float(m.group(1)), float(m.group(2))))
+
+        parsed = parsed[:-1].decode()
+        raw = raw[:-1].decode()
+        raw_bits = bytes.fromhex(raw_bits[:-1].decode())
+        return BarCode(uri, format, type, raw, parsed, raw_bits, points)
+
+    file_results = []
+    for line in stdout.splitlines(True):
+        if line.startswith((b'file://', b'Exception')):
+            file_results.append(line)
+        else:
+            file_results[-1] += line
+    return [parse(result) for result in file_results]
+
+
+def synthetic_output(n, seed=0):
+    '''Generates CommandLineRunner output for n results: a mix of small and large (multi-kilobyte, multi-line)
+       payloads, with and without raw bits, and some images with no barcode found.'''
+    import random
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789 \t\n\r\u00e9\u2639'
+    out = []
+    for ii in range(n):
+        uri = 'file:///tmp/images/image%%20%d.png' % ii
+        kind = rng.random()
+        if kind < 0.1:
+            out.append('%s: No barcode found\n' % uri)
+            continue
+        text = ''.join(rng.choice(alphabet) for jj in range(rng.choice((10, 100, 1000) if kind < 0.95 else (10000,))))
+        fmt = rng.choice(('QR_CODE', 'PDF_417', 'CODE_128', 'AZTEC', 'DATA_MATRIX'))
+        out.append('%s (format: %s, type: TEXT):\nRaw result:\n%s\nParsed result:\n%s\n' % (uri, fmt, text, text.strip()))
+        if rng.random() < 0.5:
+            bits = rng.getrandbits(8 * len(text)).to_bytes(len(text), 'big').hex()
+            out.append('Raw bits:\n  %s\n' % ' '.join(bits[jj:jj + 2] for jj in range(0, len(bits), 2)))
+        npoints = rng.choice((2, 3, 4))
+        out.append('Found %d result points.\n' % npoints)
+        out.extend('  Point %d: (%.1f,%s)\n' % (jj, rng.uniform(-1, 1000), rng.choice(('-0.5', '12.0', '345.25')))
+                   for jj in range(npoints))
+    return ''.join(out).encode()
+
+
+def bench_parse(n=100000, seed=0):
+    '''Parse synthetic CommandLineRunner output for n results with the current and previous parsers, and check
+       that they give identical results.'''
+    from . import BarCode
+    stdout = synthetic_output(n, seed)
+    results, parsed = [], {}
+    for method, parser in (('legacy', _legacy_parse), ('current', BarCode.parse_all)):
+        t0 = time.perf_counter()
+        parsed[method] = parser(stdout)
+        elapsed = time.perf_counter() - t0
+        results.append(dict(method=method, results=len(parsed[method]), megabytes=len(stdout) / 1e6, seconds=elapsed))
+    if [bc.to_dict() for bc in parsed['legacy']] != [bc.to_dict() for bc in parsed['current']]:
+        raise AssertionError("Current parser's results differ from those of the legacy parser")
+    return results
+
+
+def make_corpus(reader, directory, n=24, seed=0):
+    '''Generates n barcode images of various formats and sizes in `directory` with ZXing's CommandLineEncoder (unless
+       they're already there), and returns their filenames.'''
+    import random
+    import subprocess
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    formats = ('QR_CODE', 'DATA_MATRIX', 'AZTEC', 'PDF_417', 'CODE_128')
+    filenames = []
+    for ii in range(n):
+        fmt = formats[ii % len(formats)]
+        length = rng.choice((8, 40, 200)) if fmt != 'CODE_128' else rng.choice((8, 20))
+        text = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789') for jj in range(length))
+        size = rng.choice((200, 400, 800))
+        fn = os.path.join(directory, 'synthetic-%03d-%s.png' % (ii, fmt))
+        if not os.path.exists(fn):
+            subprocess.run([reader.java, '-Djava.awt.headless=true', '-cp', reader.classpath,
+                            'com.google.zxing.client.j2se.CommandLineEncoder', '--barcode_format', fmt,
+                            '--width', str(size), '--height', str(size // 2 if fmt == 'CODE_128' else size),
+                            '--output', fn, text], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        filenames.append(fn)
+    return filenames
+
+
+def _median_ms(fn, repeat):
+    times = []
+    for ii in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def bench_suite(reader, filenames, corpus, repeat=5, batch_sizes=(1, 4, 16, None), parse_results=10000):
+    '''Runs the standard set of benchmarks, and returns a dict of metrics. Names ending in "_per_s" are rates
+       (higher is better); all others are times (lower is better).'''
+    import subprocess
+    from io import BytesIO
+    from PIL import Image
+    from . import BarCode
+
+    metrics = {}
+
+    # JVM cold start: CommandLineRunner with no images just prints its usage and exits
+    cmd = reader._build_cmd([], False, None, False, False)
+    metrics['cold_start_ms'] = _median_ms(
+        lambda: subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), repeat)
+
+    # Latency of a single decode() call for each image
+    for fn in filenames:
+        metrics['latency_ms.' + os.path.basename(fn)] = _median_ms(lambda: reader.decode(fn), repeat)
+
+    # Throughput for the synthetic corpus, with different batch sizes
+    for bs in batch_sizes:
+        t0 = time.perf_counter()
+        reader.decode(corpus, batch_size=bs)
+        metrics['throughput_per_s.batch_%s' % (bs or 'all')] = len(corpus) / (time.perf_counter() - t0)
+
+    # Overhead of each kind of input, measured without Java so that JVM noise doesn't swamp it
+    with open(filenames[0], 'rb') as f:
+        contents = f.read()
+    with Image.open(filenames[0]) as im:
+        im.load()
+    for kind, make_input in (('path', lambda: filenames[0]), ('PIL', lambda: im), ('IOBase', lambda: BytesIO(contents))):
+        def prepare():
+            for tf in reader._prepare(make_input())[2]:
+                tf.close()
+        metrics['input_prepare_ms.' + kind] = _median_ms(prepare, repeat * 10)
+        metrics['input_decode_ms.' + kind] = _median_ms(lambda: reader.decode(make_input()), repeat)
+
+    # Parsing CommandLineRunner output
+    stdout = synthetic_output(parse_results)
+    metrics['parse_us_per_result'] = _median_ms(lambda: BarCode.parse_all(stdout), repeat) * 1000 / parse_results
+    return metrics
+
+
+def compare_results(current, baseline, threshold=0.2):
+    '''Compares the metrics from two suite runs, and returns a list of (name, baseline, current, relative change,
+       regressed) for each metric in both. A metric has regressed if it's worse by more than `threshold`.'''
+    rows = []
+    for name in sorted(set(current) & set(baseline)):
+        old, new = baseline[name], current[name]
+        change = (new - old) / old if old else 0.0
+        worse = -change if '_per_s' in name else change
+        rows.append((name, old, new, change, worse > threshold))
+    return rows
+
+
+def run_suite(reader, image_dir=None, corpus_dir=None, corpus_size=24, repeat=5):
+    '''Runs bench_suite() and returns its metrics along with details of the environment, ready to be saved as JSON.'''
+    import platform
+    from tempfile import TemporaryDirectory
+    from . import __version__
+    from .cds import java_version
+
+    with TemporaryDirectory(prefix='zxing_corpus_') as td:
+        corpus = make_corpus(reader, corpus_dir or td, corpus_size)
+        metrics = bench_suite(reader, find_images(image_dir), corpus, repeat)
+    return dict(
+        timestamp=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        python_zxing=__version__, zxing=reader.zxing_version,
+        java=next(iter((java_version(reader.java) or b'').decode(errors='replace').splitlines()), None),
+        python=sys.version.split()[0], platform=platform.platform(), cpus=os.cpu_count(),
+        metrics=metrics)
+
+
+def _legacy_prepare(im):
+    # How decode() used to write PIL images to disk, for comparison
+    tf = NamedTemporaryFile(prefix='PIL_image_', suffix='.png')
+    im.save(tf, compresslevel=0)
+    tf.flush()
+    return tf
+
+
+def bench_materialize(reader, filenames, size=(4000, 3000), repeat=5):
+    '''Time how long it takes to turn a PIL image (scaled up to `size`) into a temporary file for Java to read,
+       using the current decode() code and the previous PNG-based approach.'''
+    from PIL import Image
+
+    results = []
+    for fn in filenames:
+        with Image.open(fn) as im:
+            im = im.convert('RGB').resize(size)
+        for method in ('legacy', 'current'):
+            t0 = time.perf_counter()
+            for ii in range(repeat):
+                if method == 'legacy':
+                    _legacy_prepare(im).close()
+                else:
+                    for tf in reader._prepare(im)[2]:
+                        tf.close()
+            elapsed = (time.perf_counter() - t0) / repeat
+            results.append(dict(image=os.path.basename(fn), method=method, width=size[0], height=size[1],
+                                ms_per_image=elapsed * 1000))
+    return results
+
+
+def main(args=None):
+    p = argparse.ArgumentParser(prog='python -m zxing.bench')
+    p.add_argument('-d', '--image-dir', help='Directory of images to use (default: %(default)s)', default=default_image_dir)
+    p.add_argument('-P', '--classpath', help=argparse.SUPPRESS)
+    p.add_argument('-J', '--java', help=argparse.SUPPRESS)
+    sp = p.add_subparsers(dest='benchmark', required=True)
+    x = sp.add_parser('parallel', help='Throughput of decode_parallel() with different numbers of Java subprocesses')
+    x.add_argument('-w', '--workers', default='1,2,4,8', type=lambda s: [int(n) for n in s.split(',')],
+                   help='Comma-separated numbers of workers to try (default: %(default)s)')
+    x.add_argument('-r', '--repeat', default=8, type=int, help='Number of times to repeat each image (default: %(default)s)')
+    x = sp.add_parser('materialize', help='Overhead of writing PIL images to temporary files, before and after')
+    x.add_argument('-s', '--size', default=(4000, 3000), type=lambda s: tuple(int(n) for n in s.split('x')),
+                   help='Size to scale images up to, as WIDTHxHEIGHT (default: 4000x3000)')
+    x.add_argument('-r', '--repeat', default=5, type=int, help='Number of times to repeat each image (default: %(default)s)')
+    x = sp.add_parser('startup', help='Time to import zxing and to construct a BarCodeReader')
+    x.add_argument('-r', '--repeat', default=20, type=int, help='Number of repetitions (default: %(default)s)')
+    x = sp.add_parser('jvm', help='JVM startup time with and without a Class Data Sharing archive')
+    x.add_argument('-r', '--repeat', default=10, type=int, help='Number of repetitions (default: %(default)s)')
+    x = sp.add_parser('parse', help='Parsing speed of synthetic CommandLineRunner output, before and after')
+    x.add_argument('-n', '--results', default=100000, type=int, help='Number of results to generate (default: %(default)s)')
+    x = sp.add_parser('suite', help='Standard set of benchmarks, with JSON output for comparison between runs')
+    x.add_argument('-o', '--output', help='Save results as JSON to this file (default: print them)')
+    x.add_argument('-b', '--baseline', help='Compare results to those saved in this JSON file')
+    x.add_argument('-t', '--threshold', default=0.2, type=float,
+                   help='Relative change which counts as a regression when comparing to the baseline (default: %(default)s)')
+    x.add_argument('-c', '--corpus-dir', help='Directory for the synthetic images, which are reused if already present '
+                   '(default: a temporary directory)')
+    x.add_argument('-n', '--corpus-size', default=24, type=int, help='Number of synthetic images (default: %(default)s)')
+    x.add_argument('-r', '--repeat', default=5, type=int, help='Number of repetitions (default: %(default)s)')
+    args = p.parse_args(args)
+
+    if args.benchmark == 'parse':
+        # Doesn't need Java or images
+        print("%-8s  %7s  %8s  %8s" % ('method', 'results', 'MB', 'seconds'))
+        for r in bench_parse(args.results):
+            print("%-8s  %7d  %8.1f  %8.3f" % (r['method'], r['results'], r['megabytes'], r['seconds']))
+        return
+
+    reader = BarCodeReader(args.classpath, args.java)
+    if args.benchmark == 'suite':
+        import json
+        results = run_suite(reader, args.image_dir, args.corpus_dir, args.corpus_size, args.repeat)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            rows = compare_results(results['metrics'], baseline['metrics'], args.threshold)
+            print("%-60s  %10s  %10s  %7s" % ('metric', 'baseline', 'current', 'change'), file=sys.stderr)
+            for name, old, new, change, regressed in rows:
+                print("%-60s  %10.3f  %10.3f  %+6.1f%%%s" % (name, old, new, change * 100, '  REGRESSED' if regressed else ''),
+                      file=sys.stderr)
+            if any(r[4] for r in rows):
+                raise SystemExit(1)
+        return
+
+    filenames = find_images(args.image_dir)
+
+    if args.benchmark == 'parallel':
+        print("%7s  %6s  %8s  %8s" % ('workers', 'images', 'seconds', 'images/s'))
+        for r in bench_parallel(reader, filenames, args.workers, args.repeat):
+            print("%7d  %6d  %8.3f  %8.1f" % (r['workers'], r['images'], r['seconds'], r['images_per_second']))
+    elif args.benchmark == 'startup':
+        for r in bench_startup(reader, args.repeat):
+            print("%-35s  %8.3f ms" % (r['what'], r['ms']))
+    elif args.benchmark == 'jvm':
+        print("%-16s  %8s  %9s" % ('config', 'min ms', 'median ms'))
+        for r in bench_jvm(reader, filenames, args.repeat):
+            print("%-16s  %8.1f  %9.1f" % (r['config'], r['min_ms'], r['median_ms']))
+    elif args.benchmark == 'materialize':
+        print("%-45s  %-8s  %9s" % ('image', 'method', 'ms/image'))
+        for r in bench_materialize(reader, filenames, args.size, args.repeat):
+            print("%-45s  %-8s  %9.1f" % (r['image'], r['method'], r['ms_per_image']))
+
+
+if __name__ == '__main__':
+    main()
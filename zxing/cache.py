@@ -0,0 +1,146 @@
+########################################################################
+#
+#  Content-addressed cache of decoding results, so that repeated
+#  decodes of the same image don't have to launch Java again.
+#
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from . import BarCode, BarCodes, file_uri_to_path
+
+
+class ResultCache(object):
+    '''Cache of BarCode results, keyed by a hash of the image file contents, the decoding options, and the ZXing
+       version. Keeps up to `maxsize` results in memory (least-recently-used are evicted first), each for up to `ttl`
+       seconds. If `path` is given, results are also stored in an SQLite database at that path, which persists between
+       processes. "No barcode found" results are cached too, as are the BarCodes lists from decode(multi=True).'''
+
+    def __init__(self, maxsize=1024, ttl=None, path=None):
+        self.maxsize, self.ttl, self.path = maxsize, ttl, path
+        self.hits = self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if path is None:
+            self._db = None
+        else:
+            import sqlite3
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            with self._db:
+                self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL, result TEXT)')
+
+    def __len__(self):
+        return len(self._memory)
+
+    def __repr__(self):
+        return '{}(maxsize={!r}, ttl={!r}, path={!r}, hits={}, misses={})'.format(
+            self.__class__.__name__, self.maxsize, self.ttl, self.path, self.hits, self.misses)
+
+    @staticmethod
+    def make_key(path, options, zxing_version):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        try_harder, possible_formats, pure_barcode, products_only, *multi = options
+        h.update(repr((bool(try_harder), sorted(possible_formats or ()), bool(pure_barcode), bool(products_only),
+                       zxing_version) + (('multi',) if any(multi) else ())).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self.ttl is None or now - entry[0] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+            if self._db is not None:
+                row = self._db.execute('SELECT created, result FROM results WHERE key=?', (key,)).fetchone()
+                if row is not None:
+                    if self.ttl is None or now - row[0] < self.ttl:
+                        d = json.loads(row[1])
+                        bc = (BarCodes if 'barcodes' in d else BarCode).from_dict(d)
+                        self._remember(key, row[0], bc)
+                        self.hits += 1
+                        return bc
+                    with self._db:
+                        self._db.execute('DELETE FROM results WHERE key=?', (key,))
+            self.misses += 1
+
+    def put(self, key, bc):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, bc)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                                     (key, now, json.dumps(bc.to_dict())))
+
+    def _remember(self, key, created, bc):
+        self._memory[key] = (created, bc)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.misses = 0
+            if self._db is not None:
+                with self._db:
+                    self._db.execute('DELETE FROM results')
+
+    def lookup(self, file_uris, options, zxing_version):
+        return CacheLookup(self, file_uris, options, zxing_version)
+
+
+class CacheLookup(object):
+    '''Results of looking up a batch of images in a ResultCache. `hits` are the BarCodes already known, and
+       `misses` are the URIs which still need to be decoded (only one for each distinct image).
+       Pass each newly-decoded BarCode to add(), which caches it and returns it along with copies for any
+       duplicates of the same image.'''
+
+    def __init__(self, cache, file_uris, options, zxing_version):
+        self.cache = cache
+        self.hits, self.misses = [], []
+        self._keys, self._uris = {}, {}
+        for uri in file_uris:
+            key = self._keys.get(uri)
+            if key is None:
+                try:
+                    key = self._keys[uri] = cache.make_key(file_uri_to_path(uri), options, zxing_version)
+                except (OSError, ValueError):
+                    # Let Java report the problem with this file
+                    self.misses.append(uri)
+                    continue
+
+            bc = cache.get(key)
+            if bc is not None:
+                self.hits.append(bc._with_uri(uri))
+                continue
+            if key not in self._uris:
+                self.misses.append(uri)
+            self._uris.setdefault(key, []).append(uri)
+
+    def add(self, bc):
+        key = self._keys.get(bc.uri)
+        if key is None:
+            return [bc]
+        self.cache.put(key, bc)
+        first, *duplicates = self._uris.pop(key, [bc.uri])
+        return [bc] + [bc._with_uri(uri) for uri in duplicates]
+
+    def discard(self, uri):
+        # For an image which couldn't be decoded: returns its URI, along with those of any duplicates
+        key = self._keys.get(uri)
+        return [uri] if key is None else self._uris.pop(key, [uri])
+
+    def complete(self, codes):
+        # All the results: the hits, plus each newly-decoded BarCode and its duplicates
+        return self.hits + [c for bc in codes for c in self.add(bc)]
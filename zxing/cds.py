@@ -0,0 +1,110 @@
+########################################################################
+#
+#  Application Class Data Sharing (AppCDS) archives for the ZXing
+#  classes, which cut JVM startup time for CommandLineRunner.
+#
+#  See https://docs.oracle.com/en/java/javase/17/vm/class-data-sharing.html
+#
+
+import hashlib
+import os
+import pathlib
+import re
+import shutil
+import subprocess as sp
+import threading
+from tempfile import TemporaryDirectory
+
+_lock = threading.Lock()
+_java_versions = {}  # java binary -> output of "java -version"
+_archives = {}  # archive path -> True if usable, False if it couldn't be built
+
+# Options which make the JVM silently ignore an archive it can't use, rather than printing warnings
+# (which would get mixed up with the CommandLineRunner output)
+QUIET_OPTIONS = ['-Xshare:auto', '-Xlog:cds=off', '-Xlog:cds+dynamic=off']
+
+
+def java_version(java):
+    with _lock:
+        if java not in _java_versions:
+            try:
+                _java_versions[java] = sp.run([java, '-version'], stdout=sp.PIPE, stderr=sp.STDOUT, check=True).stdout
+            except (OSError, sp.CalledProcessError):
+                _java_versions[java] = None
+        return _java_versions[java]
+
+
+def java_major_version(version_output):
+    # 'openjdk version "1.8.0_292"' -> 8, 'openjdk version "17.0.2" 2022-01-18' -> 17
+    m = re.search(rb'version "(?:1\.)?(\d+)', version_output or b'')
+    return int(m.group(1)) if m else None
+
+
+def default_archive_path(reader, version_output):
+    # Name the archive after everything which would make it stale: the JARs, and the Java version. Only the JARs,
+    # because the archive itself (or another one) may be in the same directory, matched by a "*" in the classpath.
+    import glob
+    h = hashlib.sha256(version_output)
+    for cp in reader.classpath.split(reader.classpath_sep):
+        for fn in sorted(glob.glob(cp)):
+            if not fn.lower().endswith(('.jar', '.zip')):
+                continue
+            st = os.stat(fn)
+            h.update(repr((os.path.realpath(fn), st.st_mtime_ns, st.st_size)).encode())
+    name = 'zxing-%s-%s.jsa' % (reader.zxing_version, h.hexdigest()[:16])
+
+    # Next to the JARs if possible, otherwise in the user's cache directory
+    if reader.core_jar and os.access(os.path.dirname(reader.core_jar), os.W_OK):
+        return os.path.join(os.path.dirname(reader.core_jar), name)
+    if os.name == 'nt':
+        cache_dir = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'python-zxing', name)
+
+
+def build_archive(reader, path):
+    # Record the classes loaded while decoding a generated barcode, then dump them into an archive
+    base = [reader.java, '-Djava.awt.headless=true', '-cp', reader.classpath]
+    with TemporaryDirectory(prefix='zxing_cds_') as td:
+        image, class_list = os.path.join(td, 'training.png'), os.path.join(td, 'classes.lst')
+        sp.run(base + ['com.google.zxing.client.j2se.CommandLineEncoder', '--output', image, 'python-zxing'],
+               stdout=sp.DEVNULL, stderr=sp.DEVNULL, check=True)
+        uri = pathlib.Path(image).as_uri()
+        sp.run(base[:1] + ['-XX:DumpLoadedClassList=' + class_list] + base[1:] + [reader.cls, uri, '--try_harder'],
+               stdout=sp.DEVNULL, stderr=sp.DEVNULL, check=True)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = os.path.join(td, 'archive.jsa')
+        sp.run(base[:1] + ['-Xshare:dump', '-XX:SharedClassListFile=' + class_list, '-XX:SharedArchiveFile=' + temp_path]
+               + base[1:], stdout=sp.DEVNULL, stderr=sp.DEVNULL, check=True)
+        if not os.path.getsize(temp_path):
+            raise OSError("Empty CDS archive")
+        # Move into place atomically, in case another process is doing the same thing
+        staging = '%s.%d.tmp' % (path, os.getpid())
+        shutil.move(temp_path, staging)
+        os.replace(staging, path)
+
+
+def cds_options(reader):
+    '''Returns the JVM options to use reader.cds_archive (building it if necessary), or an empty list if it can't be used.'''
+    version_output = java_version(reader.java)
+    major = java_major_version(version_output)
+    if major is None or major < 11:
+        # AppCDS for application classes needs JDK 11+ (JDK 10 without -XX:+UseAppCDS)
+        return []
+
+    path = default_archive_path(reader, version_output) if reader.cds_archive == 'auto' else reader.cds_archive
+    with _lock:
+        usable = _archives.get(path)
+        if usable is None:
+            if os.path.exists(path):
+                usable = True
+            else:
+                try:
+                    build_archive(reader, path)
+                    usable = True
+                except (OSError, sp.CalledProcessError):
+                    usable = False
+            _archives[path] = usable
+    return ['-XX:SharedArchiveFile=' + path] + QUIET_OPTIONS if usable else []
@@ -0,0 +1,100 @@
+########################################################################
+#
+#  Frame sources for BarCodeReader.decode_frames(): multi-frame images
+#  (TIFF, GIF, ...) via PIL, videos via OpenCV (if it's installed), and
+#  a cheap perceptual hash for skipping near-duplicate frames.
+#
+
+import os
+
+from . import _array_to_grayscale, _ndarray_class, _pil_image_class, _to_grayscale
+
+
+def iter_frames(source, every_nth=1, channel_order='RGB'):
+    '''Yields (index, frame) for every `every_nth` frame of `source`, with each frame converted to a grayscale
+       PIL image or 2-D NumPy array. `source` can be the path of a multi-frame image or of a video, a PIL image,
+       an OpenCV VideoCapture, or any iterable of PIL images and/or NumPy arrays.'''
+    PILImage = _pil_image_class()
+    if isinstance(source, (str, os.PathLike)):
+        try:
+            from PIL import Image, UnidentifiedImageError
+        except ImportError:
+            yield from _iter_capture(_open_video(source), every_nth)
+            return
+        try:
+            im = Image.open(source)
+        except UnidentifiedImageError:
+            yield from _iter_capture(_open_video(source), every_nth)
+            return
+        with im:
+            yield from _iter_pil(im, every_nth)
+    elif PILImage and isinstance(source, PILImage):
+        yield from _iter_pil(source, every_nth)
+    elif hasattr(source, 'grab') and hasattr(source, 'retrieve'):
+        yield from _iter_capture(source, every_nth)
+    else:
+        ndarray = _ndarray_class()
+        for index, frame in enumerate(source):
+            if index % every_nth == 0:
+                if ndarray and isinstance(frame, ndarray):
+                    yield index, _array_to_grayscale(frame, channel_order)
+                else:
+                    yield index, _to_grayscale(frame)
+
+
+def _iter_pil(im, every_nth):
+    from PIL import ImageSequence
+
+    for index, frame in enumerate(ImageSequence.Iterator(im)):
+        if index % every_nth == 0:
+            # The frame is the same object each time (just seeked to the next frame), so it has to be copied
+            gray = _to_grayscale(frame)
+            yield index, gray.copy() if gray is frame else gray
+
+
+def _open_video(path):
+    try:
+        import cv2
+    except ImportError:
+        raise ValueError("Cannot read frames from %r: it's not an image, and OpenCV (cv2) is not installed" % path) from None
+    cap = cv2.VideoCapture(os.fspath(path))
+    if not cap.isOpened():
+        cap.release()
+        raise ValueError("Cannot read frames from %r" % path)
+    return cap
+
+
+def _iter_capture(cap, every_nth):
+    import cv2
+
+    try:
+        index = 0
+        # Frames which are skipped are only grabbed, not decoded
+        while cap.grab():
+            if index % every_nth == 0:
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+                yield index, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def dhash(frame):
+    '''64-bit difference hash of a grayscale PIL image or 2-D NumPy array: each bit is whether a pixel of the frame,
+       shrunk to 9x8, is brighter than its neighbour to the right. Near-identical frames have hashes which differ in
+       only a few bits.'''
+    ndarray = _ndarray_class()
+    if ndarray and isinstance(frame, ndarray):
+        h, w = frame.shape
+        rows = [frame[(h - 1) * ii // 7] for ii in range(8)]
+        pixels = [int(row[(w - 1) * jj // 8]) for row in rows for jj in range(9)]
+    else:
+        from PIL import Image
+        pixels = list(frame.convert('L').resize((9, 8), Image.BILINEAR).tobytes())
+    bits = 0
+    for ii in range(8):
+        for jj in range(8):
+            bits = (bits << 1) | (pixels[ii * 9 + jj] > pixels[ii * 9 + jj + 1])
+    return bits
@@ -0,0 +1,140 @@
+########################################################################
+#
+#  In-process decoding backend, using JPype to call the ZXing Java
+#  classes directly instead of launching CommandLineRunner for each
+#  decode() call. The JVM is started once per Python process.
+#
+
+import os
+import shutil
+import threading
+
+from . import BarCode, BarCodeReaderException, _file_not_found_error, file_uri_to_path
+
+_lock = threading.Lock()
+_classes = None
+_jvm_config = None  # (classpath, JVM options) of the reader which started the JVM
+
+# Same default format lists as com.google.zxing.client.j2se.DecoderConfig.buildHints()
+PRODUCT_FORMATS = ('UPC_A', 'UPC_E', 'EAN_13', 'EAN_8', 'RSS_14', 'RSS_EXPANDED')
+OTHER_FORMATS = ('CODE_39', 'CODE_93', 'CODE_128', 'ITF', 'QR_CODE', 'DATA_MATRIX', 'AZTEC', 'PDF_417', 'CODABAR', 'MAXICODE')
+
+
+def find_libjvm(java):
+    # Prefer the JVM belonging to the same java binary that the subprocess backend would run
+    exe = shutil.which(java)
+    if exe:
+        java_home = os.path.dirname(os.path.dirname(os.path.realpath(exe)))
+        for sub in (('lib', 'server', 'libjvm.so'), ('lib', 'server', 'libjvm.dylib'), ('bin', 'server', 'jvm.dll'),
+                    ('jre', 'lib', 'amd64', 'server', 'libjvm.so')):
+            fn = os.path.join(java_home, *sub)
+            if os.path.exists(fn):
+                return fn
+
+    import jpype
+    return jpype.getDefaultJVMPath()
+
+
+def _start_jvm(reader):
+    global _classes, _jvm_config
+
+    with _lock:
+        if _classes is not None:
+            # There's only one JVM per process, and its classpath and options can't be changed once it has started
+            if (reader.classpath, list(reader.jvm_options)) != _jvm_config:
+                raise BarCodeReaderException("Java virtual machine already started with a different classpath or options "
+                                             "(%s)" % _jvm_config[0], reader.classpath)
+            return _classes
+
+        try:
+            import jpype
+        except ImportError as e:
+            raise BarCodeReaderException("JPype must be installed to use the jpype backend", reader.java) from e
+
+        if not jpype.isJVMStarted():
+            try:
+                jpype.startJVM(find_libjvm(reader.java), '-Djava.awt.headless=true', *reader.jvm_options,
+                               classpath=reader.classpath.split(reader.classpath_sep), convertStrings=False)
+            except (OSError, jpype.JVMNotFoundException) as e:
+                raise BarCodeReaderException("Could not start Java virtual machine", reader.java) from e
+
+        try:
+            c = {n.rsplit('.', 1)[1]: jpype.JClass(n) for n in (
+                'com.google.zxing.BarcodeFormat', 'com.google.zxing.BinaryBitmap', 'com.google.zxing.DecodeHintType',
+                'com.google.zxing.MultiFormatReader', 'com.google.zxing.NotFoundException',
+                'com.google.zxing.client.j2se.BufferedImageLuminanceSource', 'com.google.zxing.client.j2se.ImageReader',
+                'com.google.zxing.client.result.ResultParser', 'com.google.zxing.common.HybridBinarizer',
+                'com.google.zxing.multi.GenericMultipleBarcodeReader',
+                'java.io.FileNotFoundException', 'java.io.IOException', 'java.lang.Boolean', 'java.lang.Float',
+                'java.net.URI', 'java.util.ArrayList', 'java.util.EnumMap', 'javax.imageio.IIOException')}
+        except TypeError as e:
+            raise BarCodeReaderException("Java JARs not found in classpath (%s)" % reader.classpath, reader.classpath) from e
+        c['JException'] = jpype.JException
+        _classes, _jvm_config = c, (reader.classpath, list(reader.jvm_options))
+        return c
+
+
+def _build_hints(c, try_harder, possible_formats, pure_barcode, products_only):
+    formats = c['ArrayList']()
+    for f in (possible_formats or (PRODUCT_FORMATS if products_only else PRODUCT_FORMATS + OTHER_FORMATS)):
+        formats.add(c['BarcodeFormat'].valueOf(f))
+    hints = c['EnumMap'](c['DecodeHintType'])
+    hints.put(c['DecodeHintType'].POSSIBLE_FORMATS, formats)
+    if try_harder:
+        hints.put(c['DecodeHintType'].TRY_HARDER, c['Boolean'].TRUE)
+    if pure_barcode:
+        hints.put(c['DecodeHintType'].PURE_BARCODE, c['Boolean'].TRUE)
+    return hints
+
+
+def _to_barcode(c, uri, result, raw_bits):
+    parsed = c['ResultParser'].parseResult(result)
+    rb = result.getRawBytes() if raw_bits else None
+    # Use Java's own float formatting, so that points are identical to what CommandLineRunner prints
+    points = [(float(str(c['Float'].toString(p.getX()))), float(str(c['Float'].toString(p.getY()))))
+              for p in (result.getResultPoints() or ())]
+    return BarCode(uri, str(result.getBarcodeFormat()), str(parsed.getType()), str(result.getText()),
+                   str(parsed.getDisplayResult()), bytes(rb) if rb is not None else b'', points)
+
+
+def decode_uris(reader, file_uris, try_harder=False, possible_formats=None, pure_barcode=False, products_only=False,
+                multi=False):
+    c = _start_jvm(reader)
+    try:
+        hints = _build_hints(c, try_harder, possible_formats, pure_barcode, products_only)
+    except c['JException'] as e:
+        # e.g. an unknown format; CommandLineRunner fails the same way
+        raise BarCodeReaderException("Unknown Java exception", reader.java) from e
+    # CommandLineRunner only outputs raw bits with --raw, which we only use with v3.5.3+ (see BarCodeReader.decode)
+    raw_bits = bool(reader.zxing_version_info and reader.zxing_version_info >= (3, 5, 3))
+
+    codes = []
+    for uri in file_uris:
+        try:
+            image = c['ImageReader'].readImage(c['URI'](uri))
+        except c['IOException'] as e:
+            cause = e.getCause()
+            if isinstance(cause, c['FileNotFoundException']):
+                fn, err = _file_not_found_error(str(cause.getMessage()))
+                raise BarCodeReaderException("Java library could not read image", fn) from err
+            elif str(e.getMessage()).startswith('Could not load '):
+                raise BarCodeReaderException("Java library could not read image (is it in a supported format?)",
+                                             file_uri_to_path(uri)) from e
+            elif isinstance(e, c['IIOException']):
+                raise BarCodeReaderException("Java library could not read image (is it corrupt?)", file_uri_to_path(uri)) from e
+            raise BarCodeReaderException("Unknown Java exception", reader.java) from e
+
+        bitmap = c['BinaryBitmap'](c['HybridBinarizer'](c['BufferedImageLuminanceSource'](image)))
+        try:
+            if multi:
+                # Like CommandLineRunner --multi, one BarCode for each barcode found
+                results = c['GenericMultipleBarcodeReader'](c['MultiFormatReader']()).decodeMultiple(bitmap, hints)
+            else:
+                results = [c['MultiFormatReader']().decode(bitmap, hints)]
+        except c['NotFoundException']:
+            codes.append(BarCode(uri, None, None, None, None, None))
+        except c['JException'] as e:
+            raise BarCodeReaderException("Unknown Java exception", reader.java) from e
+        else:
+            codes += (_to_barcode(c, uri, result, raw_bits) for result in results)
+    return codes
@@ -0,0 +1,174 @@
+########################################################################
+#
+#  Decoding an unbounded stream of images listed in a manifest (paths
+#  or data: URIs), in bounded memory, with the results appended to a
+#  JSONL or CSV file and a checkpoint from which to resume after a crash.
+#
+
+import csv
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from . import BarCodeReaderException, data_uri_to_fobj
+
+
+def describe_error(e):
+    return e.message + ((': ' + e.filename) if e.filename else '') + (('\n\tCaused by: ' + repr(e.__cause__) if e.__cause__ else ''))
+
+
+def read_manifest(f, delimiter='\n', chunk_size=65536):
+    '''Yields each entry of a manifest read from the binary file `f`: paths or data: URIs, separated by
+       `delimiter` ('\\n' or '\\0'). Empty entries are skipped, as are trailing carriage returns with '\\n'.'''
+    delimiter = delimiter.encode() if isinstance(delimiter, str) else delimiter
+    rest = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        *entries, rest = (rest + chunk).split(delimiter)
+        for entry in entries:
+            entry = entry.rstrip(b'\r') if delimiter == b'\n' else entry
+            if entry:
+                yield os.fsdecode(entry)
+    rest = rest.rstrip(b'\r') if delimiter == b'\n' else rest
+    if rest:
+        yield os.fsdecode(rest)
+
+
+def _load_checkpoint(path):
+    # Returns (number of manifest entries done, size of the output file after writing their results)
+    try:
+        with open(path) as f:
+            d = json.load(f)
+    except FileNotFoundError:
+        return 0, 0
+    return d['records'], d['output_bytes']
+
+
+def _save_checkpoint(path, records, output_bytes):
+    # Replace the checkpoint atomically, so that a crash leaves either the old one or the new one
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp_path, 'w') as f:
+        json.dump(dict(records=records, output_bytes=output_bytes), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def _decode_batch(reader, entries, options):
+    # Returns [(name, BarCode or BarCodeReaderException)] for the entries
+    names, inputs, results = [], [], {}
+    for ii, entry in enumerate(entries):
+        if entry.startswith('data:'):
+            try:
+                ff = data_uri_to_fobj(entry)
+            except ValueError as exc:
+                names.append(entry)
+                results[ii] = BarCodeReaderException(exc.args[0])
+                continue
+            names.append(ff.name)
+            inputs.append(ff)
+        else:
+            names.append(entry)
+            inputs.append(entry)
+    codes = iter(reader.decode(inputs, errors='return', **options) if inputs else ())
+    return [(name, results[ii] if ii in results else next(codes)) for ii, name in enumerate(names)]
+
+
+def _format_batch(results, first_index, format):
+    out = io.StringIO()
+    if format == 'csv':
+        wr = csv.writer(out)
+        for name, bc in results:
+            error = isinstance(bc, BarCodeReaderException)
+            wr.writerow((name, bc.format, bc.type, bc.raw, bc.parsed) if bc and not error else (name, 'ERROR', None, None, None))
+    else:
+        for index, (name, bc) in enumerate(results, first_index):
+            if isinstance(bc, BarCodeReaderException):
+                d = dict(index=index, filename=name, error=describe_error(bc))
+            else:
+                d = dict(index=index, filename=name, **bc.to_dict())
+            out.write(json.dumps(d) + '\n')
+    return out.getvalue().encode()
+
+
+def decode_manifest(reader, manifest, output, checkpoint=None, format='jsonl', delimiter='\n', batch_size=100, jobs=1,
+                    **options):
+    '''Decodes each image listed in `manifest` (a path, or a binary file object; see read_manifest), in batches of
+       `batch_size` with at most 2 * `jobs` batches in flight at once, and writes one record per image to `output`
+       (a path, or a binary file object), in manifest order. With `checkpoint` (a path), the progress is saved after
+       each batch, and a run with an existing checkpoint skips the images already done, and appends to `output` after
+       the last complete batch. Other keyword arguments are passed to BarCodeReader.decode().
+
+       Returns a dict with the number of `records` written by this run, and how many of them were `barcodes` and
+       `errors`.'''
+    if format not in ('jsonl', 'csv'):
+        raise ValueError("format must be 'jsonl' or 'csv'")
+    if checkpoint is not None and not isinstance(output, (str, os.PathLike)):
+        raise ValueError("output must be a path to use a checkpoint")
+
+    records, output_bytes = _load_checkpoint(checkpoint) if checkpoint is not None else (0, 0)
+    if isinstance(output, (str, os.PathLike)):
+        if records or output_bytes:
+            out = open(output, 'r+b')
+            if out.seek(0, os.SEEK_END) < output_bytes:
+                out.close()
+                raise ValueError("%s is shorter than the checkpoint %s says it should be" % (output, checkpoint))
+            # Throw away anything written after the checkpoint was saved
+            out.truncate(output_bytes)
+            out.seek(output_bytes)
+        else:
+            out = open(output, 'wb')
+    else:
+        out = output
+
+    manifest_file = open(manifest, 'rb') if isinstance(manifest, (str, os.PathLike)) else manifest
+    counts = dict(records=0, barcodes=0, errors=0)
+    try:
+        if format == 'csv' and output_bytes == 0:
+            header = b'Filename,Format,Type,Raw,Parsed\r\n'
+            out.write(header)
+            output_bytes += len(header)
+        entries = islice(read_manifest(manifest_file, delimiter), records, None)
+
+        def write(batch, future):
+            nonlocal records, output_bytes
+            results = future.result()
+            data = _format_batch(results, records, format)
+            out.write(data)
+            out.flush()
+            records += len(results)
+            output_bytes += len(data)
+            counts['records'] += len(results)
+            counts['barcodes'] += sum(1 for name, bc in results if bc and not isinstance(bc, BarCodeReaderException))
+            counts['errors'] += sum(1 for name, bc in results if isinstance(bc, BarCodeReaderException))
+            if checkpoint is not None:
+                # The results must be on disk before the checkpoint says they are
+                os.fsync(out.fileno())
+                _save_checkpoint(checkpoint, records, output_bytes)
+
+        pending = deque()
+        with ThreadPoolExecutor(jobs) as executor:
+            try:
+                while True:
+                    batch = list(islice(entries, batch_size))
+                    if not batch:
+                        break
+                    pending.append((batch, executor.submit(_decode_batch, reader, batch, options)))
+                    if len(pending) >= 2 * jobs:
+                        write(*pending.popleft())
+                while pending:
+                    write(*pending.popleft())
+            finally:
+                for batch, future in pending:
+                    future.cancel()
+    finally:
+        if manifest_file is not manifest:
+            manifest_file.close()
+        if out is not output:
+            out.close()
+    return counts
@@ -0,0 +1,85 @@
+########################################################################
+#
+#  Micro-batching: items submitted one at a time, from any thread, are
+#  grouped into small batches so that each batch costs only one Java
+#  process (or one call into the JVM).
+#
+
+import queue
+import threading
+from concurrent.futures import Future
+from time import monotonic
+
+_STOP = object()
+
+
+class MicroBatcher(object):
+    '''Collects items submitted from any thread into batches, and passes each batch to `handler(items)` in a
+       background thread; `handler` must return a list of results, one for each item. A batch is closed as soon as
+       it has `max_size` items, or `max_wait` seconds after its first item arrived. With `max_pending`, no more than
+       that many items can be waiting for a batch, and submit() blocks or raises queue.Full beyond that.'''
+
+    def __init__(self, handler, max_size=50, max_wait=0.2, max_pending=None):
+        self.handler, self.max_size, self.max_wait = handler, max_size, max_wait
+        self.batches = 0
+        self._queue = queue.Queue(max_pending or 0)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='zxing-microbatch', daemon=True)
+        self._thread.start()
+
+    def submit(self, item, block=True, timeout=None):
+        '''Returns a Future for the result of `item`.'''
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((item, future), block, timeout)
+        return future
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self, wait=True):
+        '''Stops accepting items; those already submitted are still handled.'''
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, deadline = [first], monotonic() + self.max_wait
+            while len(batch) < self.max_size:
+                try:
+                    entry = self._queue.get(timeout=max(deadline - monotonic(), 0))
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        self.batches += 1
+        try:
+            results = self.handler([item for item, future in batch])
+        except BaseException as e:
+            for item, future in batch:
+                future.set_exception(e)
+        else:
+            for (item, future), result in zip(batch, results):
+                future.set_result(result)
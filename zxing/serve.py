@@ -0,0 +1,261 @@
+########################################################################
+#
+#  A local HTTP decoding service, so that several programs can share one
+#  BarCodeReader. Images from concurrent requests are coalesced into
+#  micro-batches, each decoded by a single Java process.
+#
+
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from socketserver import ThreadingMixIn
+from time import perf_counter
+from urllib.parse import parse_qs, urlsplit
+
+from . import BarCodeReaderException, data_uri_to_fobj
+from .manifest import describe_error
+from .microbatch import MicroBatcher
+
+
+class _Histogram(object):
+    # A Prometheus-style histogram: counts of observations no greater than each bucket's upper bound
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[next((ii for ii, b in enumerate(self.buckets) if value <= b), len(self.buckets))] += 1
+            self.sum += value
+
+    def lines(self, name, help):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        out = ['# HELP %s %s' % (name, help), '# TYPE %s histogram' % name]
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            out.append('%s_bucket{le="%s"} %d' % (name, '+Inf' if bound == float('inf') else repr(bound), cumulative))
+        out += ['%s_sum %r' % (name, total), '%s_count %d' % (name, cumulative)]
+        return out
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class DecodeServer(object):
+    '''HTTP service which decodes images with `reader`. POST images to /decode as a raw request body, as the files of a
+       multipart/form-data request, or as data: URIs (one per line); options can be given in the query string
+       (?try_harder=1&possible_formats=QR_CODE,EAN_13), and otherwise default to the keyword arguments. The response
+       is JSON: {"results": [...]}, with one BarCode dict (or {"error": ...}) for each image. GET /metrics returns
+       the queue depth, counters, and latency histograms in the Prometheus text format.
+
+       Images from concurrent requests with the same options are decoded together, in batches of up to `max_batch`
+       images closed `max_wait` seconds after the first one arrived. If `max_queue` images are already waiting, new
+       requests are refused with 503 Service Unavailable, and request bodies larger than `max_body` bytes with 413.'''
+
+    latency_buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, reader, host='127.0.0.1', port=8080, max_batch=50, max_wait=0.05, max_queue=256,
+                 max_body=32 << 20, **options):
+        self.reader, self.max_batch, self.max_wait, self.max_queue, self.max_body = reader, max_batch, max_wait, max_queue, max_body
+        self.options = options
+        self._batchers = {}
+        self._lock = threading.Lock()
+        self.requests = {}  # HTTP status -> count
+        self.images = 0
+        self.request_latency = _Histogram(self.latency_buckets)
+        self.batch_latency = _Histogram(self.latency_buckets)
+        self.batch_size = _Histogram((1, 2, 5, 10, 20, 50, 100, 200))
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.service = self
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def serve_forever(self):
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            for batcher in list(self._batchers.values()):
+                batcher.close()
+
+    def shutdown(self):
+        '''Stops serve_forever(), from another thread.'''
+        self.httpd.shutdown()
+
+    def queue_depth(self):
+        return sum(b.pending() for b in list(self._batchers.values()))
+
+    def _batcher(self, options):
+        key = tuple(sorted(options.items()))
+        with self._lock:
+            batcher = self._batchers.get(key)
+            if batcher is None:
+                batcher = self._batchers[key] = MicroBatcher(lambda images: self._decode(images, options), self.max_batch,
+                                                             self.max_wait, self.max_queue)
+            return batcher
+
+    def _decode(self, images, options):
+        t0 = perf_counter()
+        try:
+            return self.reader.decode(images, errors='return', **options)
+        finally:
+            self.batch_latency.observe(perf_counter() - t0)
+            self.batch_size.observe(len(images))
+
+    def decode(self, images, options):
+        '''Returns a list of BarCodes or BarCodeReaderExceptions for the images, or raises queue.Full.'''
+        if self.queue_depth() + len(images) > self.max_queue:
+            raise queue.Full
+        batcher = self._batcher(options)
+        futures = []
+        try:
+            for image in images:
+                futures.append(batcher.submit(image, block=False))
+        except queue.Full:
+            for f in futures:
+                f.cancel()
+            raise
+        with self._lock:
+            self.images += len(images)
+        return [f.result() for f in futures]
+
+    def count_request(self, status, latency):
+        with self._lock:
+            self.requests[status] = self.requests.get(status, 0) + 1
+        self.request_latency.observe(latency)
+
+    def metrics(self):
+        with self._lock:
+            requests, images = dict(self.requests), self.images
+        lines = ['# HELP zxing_queue_depth Images waiting to be decoded', '# TYPE zxing_queue_depth gauge',
+                 'zxing_queue_depth %d' % self.queue_depth(),
+                 '# HELP zxing_requests_total HTTP requests to /decode, by status', '# TYPE zxing_requests_total counter']
+        lines += ['zxing_requests_total{status="%d"} %d' % (status, n) for status, n in sorted(requests.items())]
+        lines += ['# HELP zxing_images_total Images submitted for decoding', '# TYPE zxing_images_total counter',
+                  'zxing_images_total %d' % images,
+                  '# HELP zxing_batches_total Batches decoded', '# TYPE zxing_batches_total counter',
+                  'zxing_batches_total %d' % sum(b.batches for b in list(self._batchers.values()))]
+        lines += self.request_latency.lines('zxing_request_duration_seconds', 'Time to handle a /decode request')
+        lines += self.batch_latency.lines('zxing_batch_duration_seconds', 'Time to decode a batch')
+        lines += self.batch_size.lines('zxing_batch_size', 'Images per batch')
+        return '\n'.join(lines) + '\n'
+
+
+def _parse_options(query, defaults):
+    options = dict(defaults)
+    q = parse_qs(query)
+    for name in ('try_harder', 'pure_barcode', 'products_only'):
+        if name in q:
+            options[name] = q[name][-1].lower() not in ('0', 'false', 'no', '')
+    if 'possible_formats' in q:
+        options['possible_formats'] = tuple(f for fs in q['possible_formats'] for f in fs.split(',') if f) or None
+    elif options.get('possible_formats'):
+        options['possible_formats'] = tuple(options['possible_formats'])
+    return options
+
+
+def _parse_body(content_type, body):
+    # Returns a list of (filename, BytesIO or BarCodeReaderException)
+    if content_type.startswith('multipart/form-data'):
+        from email.parser import BytesParser
+        from email.policy import HTTP
+        msg = BytesParser(policy=HTTP).parsebytes(b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+        if not msg.is_multipart():
+            raise ValueError("Malformed multipart/form-data body")
+        return [(part.get_filename(), BytesIO(part.get_payload(decode=True))) for part in msg.iter_parts()
+                if part.get_filename() is not None]
+    elif body.startswith(b'data:'):
+        images = []
+        for line in body.decode('ascii', 'replace').split():
+            try:
+                images.append((None, data_uri_to_fobj(line)))
+            except ValueError as exc:
+                images.append((None, BarCodeReaderException(exc.args[0])))
+        return images
+    else:
+        return [(None, BytesIO(body))] if body else []
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'python-zxing'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json', headers=()):
+        data = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, message, headers=()):
+        self._send(status, json.dumps(dict(error=message)), headers=headers)
+        return status
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/metrics':
+            self._send(200, self.server.service.metrics(), 'text/plain; version=0.0.4')
+        else:
+            self._error(404, 'Not found')
+
+    def do_POST(self):
+        t0 = perf_counter()
+        service = self.server.service
+        url = urlsplit(self.path)
+        if url.path != '/decode':
+            self._error(404, 'Not found')
+            return
+        status = self._decode(service, url.query)
+        service.count_request(status, perf_counter() - t0)
+
+    def _decode(self, service, query):
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            return self._error(411, 'Content-Length required')
+        if length > service.max_body:
+            self.close_connection = True
+            return self._error(413, 'Request body too large')
+        body = self.rfile.read(length)
+
+        try:
+            options = _parse_options(query, service.options)
+            images = _parse_body(self.headers.get('Content-Type', ''), body)
+        except ValueError as exc:
+            return self._error(400, str(exc))
+        if not images:
+            return self._error(400, 'No images in request')
+
+        todo = [im for fn, im in images if not isinstance(im, BarCodeReaderException)]
+        try:
+            codes = iter(service.decode(todo, options) if todo else ())
+        except queue.Full:
+            return self._error(503, 'Too many images waiting to be decoded', headers=[('Retry-After', '1')])
+        except BarCodeReaderException as e:
+            return self._error(500, describe_error(e))
+
+        results = []
+        for fn, im in images:
+            bc = im if isinstance(im, BarCodeReaderException) else next(codes)
+            if isinstance(bc, BarCodeReaderException):
+                d = dict(error=bc.message)  # Without the name of the temporary file
+            else:
+                d = bc.to_dict()
+                del d['uri']  # A temporary file
+            results.append(dict(filename=fn, **d) if fn is not None else d)
+        self._send(200, json.dumps(dict(results=results)))
+        return 200
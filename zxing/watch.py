@@ -0,0 +1,196 @@
+########################################################################
+#
+#  Hot folder: decode the images which appear in a directory, in
+#  micro-batches, and move each one into a done/ or failed/ subfolder
+#  with its result alongside it. Uses inotify on Linux, and polling
+#  elsewhere.
+#
+
+import json
+import os
+import select
+import shutil
+import struct
+import threading
+
+from . import BarCodeReaderException
+from .manifest import describe_error
+from .microbatch import MicroBatcher
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_event_header = struct.Struct('iIII')
+
+
+class _Inotify(object):
+    # Reports the names of files in a directory which have been closed after writing, or moved into it
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        try:
+            init1, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except AttributeError:
+            raise OSError("inotify is not available") from None
+        self.fd = init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed", directory)
+
+    def read(self, timeout):
+        # Returns (names, overflowed)
+        names, overflowed = [], False
+        if select.select([self.fd], [], [], timeout)[0]:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return names, overflowed
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = _event_header.unpack_from(data, pos)
+                pos += _event_header.size
+                if mask & IN_Q_OVERFLOW:
+                    overflowed = True
+                elif length:
+                    names.append(os.fsdecode(data[pos:pos + length].rstrip(b'\0')))
+                pos += length
+        return names, overflowed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class HotFolder(object):
+    '''Watches `directory` for new images, and decodes them with `reader` in micro-batches of up to `max_batch` files,
+       each closed `max_wait` seconds after its first file arrived. Each file is then moved into `done_dir` (if a
+       barcode was found) or `failed_dir` (if not, or if it couldn't be read), default "done" and "failed" inside
+       `directory`, along with a sidecar FILE.json containing the result. Files whose names start with "." are
+       ignored, so that writers can create them under a temporary name and rename them once they're complete.
+
+       A file is ready to decode once inotify reports that it has been closed after writing (or moved into the
+       directory), or, without inotify, once its size and modification time haven't changed for `poll_interval`
+       seconds. With inotify=None, inotify is used if available. Other keyword arguments are passed to decode(), and
+       `on_result(path, new_path, result)` is called after each file is moved.'''
+
+    def __init__(self, reader, directory, done_dir=None, failed_dir=None, max_batch=50, max_wait=0.2, poll_interval=0.5,
+                 inotify=None, on_result=None, **options):
+        self.reader, self.directory = reader, directory
+        self.done_dir = os.path.join(directory, 'done') if done_dir is None else done_dir
+        self.failed_dir = os.path.join(directory, 'failed') if failed_dir is None else failed_dir
+        self.max_batch, self.max_wait, self.poll_interval = max_batch, max_wait, poll_interval
+        self.inotify, self.on_result, self.options = inotify, on_result, options
+        self._stop = threading.Event()
+        self._submitted = set()
+        self._candidates = {}
+        self._error = None
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        '''Decodes files as they appear, until stop() is called (from another thread or a callback) or decoding fails
+           for a reason other than a bad image, in which case the exception is raised.'''
+        os.makedirs(self.done_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+        watch = None
+        if self.inotify is not False:
+            try:
+                watch = _Inotify(self.directory)
+            except OSError:
+                if self.inotify:
+                    raise
+
+        batcher = MicroBatcher(self._handle, self.max_batch, self.max_wait)
+        try:
+            scanning = True
+            while not self._stop.is_set():
+                ready = []
+                if scanning:
+                    ready = self._scan()
+                    # With inotify, we only need to keep scanning until the files which were already here have settled
+                    scanning = watch is None or bool(self._candidates)
+                if watch is None:
+                    self._stop.wait(self.poll_interval)
+                else:
+                    names, overflowed = watch.read(self.poll_interval)
+                    ready += (os.path.join(self.directory, n) for n in names if self._wanted(n))
+                    scanning = scanning or overflowed
+                for path in ready:
+                    if path not in self._submitted and os.path.isfile(path):
+                        self._submitted.add(path)
+                        batcher.submit(path).add_done_callback(lambda f, path=path: self._done(path, f))
+        finally:
+            batcher.close()
+            if watch is not None:
+                watch.close()
+        if self._error is not None:
+            raise self._error
+
+    @staticmethod
+    def _wanted(name):
+        return not name.startswith('.')
+
+    def _scan(self):
+        # Returns the files whose size and modification time are the same as when we last looked
+        ready, candidates = [], {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not self._wanted(entry.name) or entry.path in self._submitted:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                signature = (st.st_size, st.st_mtime_ns)
+                if self._candidates.get(entry.path) == signature:
+                    ready.append(entry.path)
+                else:
+                    candidates[entry.path] = signature
+        self._candidates = candidates
+        return ready
+
+    def _done(self, path, future):
+        self._submitted.discard(path)
+        if future.exception() is not None and self._error is None:
+            self._error = future.exception()
+            self._stop.set()
+
+    def _handle(self, paths):
+        results = self.reader.decode(paths, errors='return', **self.options)
+        for path, result in zip(paths, results):
+            error = isinstance(result, BarCodeReaderException)
+            new_path = self._move(path, self.done_dir if result and not error else self.failed_dir)
+            if new_path is None:
+                continue
+            record = dict(filename=os.path.basename(path), error=describe_error(result)) if error else dict(
+                filename=os.path.basename(path), **result.to_dict())
+            temp_path = os.path.join(os.path.dirname(new_path), '.%s.json.tmp' % os.path.basename(new_path))
+            with open(temp_path, 'w') as f:
+                json.dump(record, f)
+            os.replace(temp_path, new_path + '.json')
+            if self.on_result is not None:
+                self.on_result(path, new_path, result)
+        return results
+
+    @staticmethod
+    def _move(path, directory):
+        # Move the file into the directory, without replacing an earlier file of the same name
+        base, ext = os.path.splitext(os.path.basename(path))
+        new_path, n = os.path.join(directory, base + ext), 0
+        while os.path.exists(new_path):
+            n += 1
+            new_path = os.path.join(directory, '%s-%d%s' % (base, n, ext))
+        try:
+            shutil.move(path, new_path)
+        except FileNotFoundError:
+            return None  # Someone else took it
+        return new_path
@@ -0,0 +1,316 @@
+########################################################################
+#
+#  A pool of long-lived decoder processes, each hosting a warm JVM (via
+#  JPype), which take decode jobs over stdin/stdout. This avoids starting
+#  a JVM for every request, and lets a stuck job be killed without
+#  taking down the caller.
+#
+#  Frames are a 4-byte big-endian length followed by that many bytes of
+#  UTF-8 JSON. The worker sends {"ready": true} once its JVM has started,
+#  then answers each {"id", "uris", "options", "errors"} job with
+#  {"id", "results"} or {"id", "error"}. Every reply includes the
+#  worker's resident set size, "rss", in bytes.
+#
+
+import argparse
+import json
+import os
+import queue
+import struct
+import subprocess as sp
+import sys
+import threading
+from time import perf_counter
+
+from . import BarCode, BarCodeReader, BarCodeReaderException, DecodeStats, file_uri_to_path
+
+_frame_header = struct.Struct('>I')
+
+
+def _write_frame(f, obj):
+    data = json.dumps(obj).encode()
+    f.write(_frame_header.pack(len(data)) + data)
+    f.flush()
+
+
+def _read_frame(f):
+    # Returns the next object, or None at EOF
+    header = f.read(_frame_header.size)
+    if len(header) < _frame_header.size:
+        return None
+    size, = _frame_header.unpack(header)
+    data = f.read(size)
+    return json.loads(data.decode()) if len(data) == size else None
+
+
+def _rss():
+    # Resident set size of this process in bytes (or the peak, where the current size isn't available)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    except ImportError:
+        return 0
+
+
+def _error_dict(e):
+    return dict(message=e.message, filename=e.filename)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Decoder worker process for zxing.worker.WorkerPool; not for direct use')
+    p.add_argument('--classpath')
+    p.add_argument('--java')
+    p.add_argument('--zxing-version')
+    p.add_argument('--jvm-option', action='append', default=[])
+    args = p.parse_args(argv)
+
+    # Keep stdout for the protocol, and send anything else which would be printed there (e.g. by the JVM) to stderr
+    out = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    inp = sys.stdin.buffer
+
+    try:
+        reader = BarCodeReader(args.classpath, args.java, backend='jpype', zxing_version=args.zxing_version,
+                               jvm_options=args.jvm_option)
+        from .jpype_backend import _start_jvm
+        _start_jvm(reader)
+    except BarCodeReaderException as e:
+        _write_frame(out, dict(ready=False, error=_error_dict(e), rss=_rss()))
+        return 1
+    _write_frame(out, dict(ready=True, rss=_rss()))
+
+    while True:
+        job = _read_frame(inp)
+        if job is None:
+            return 0
+        try:
+            codes = reader.decode([file_uri_to_path(uri) for uri in job['uris']], errors=job.get('errors', 'raise'),
+                                  **job['options'])
+        except BarCodeReaderException as e:
+            reply = dict(id=job['id'], error=_error_dict(e))
+        except Exception as e:
+            # Whatever went wrong, it was this job's problem; stay alive for the next one
+            reply = dict(id=job['id'], error=dict(message="Unexpected error in worker process: %r" % e, filename=None))
+        else:
+            reply = dict(id=job['id'], results=[dict(error=_error_dict(c)) if isinstance(c, BarCodeReaderException)
+                                                else c.to_dict() for c in codes])
+        reply['rss'] = _rss()
+        _write_frame(out, reply)
+
+
+class _Worker(object):
+    def __init__(self, cmd):
+        self.p = sp.Popen(cmd, stdin=sp.PIPE, stdout=sp.PIPE)
+        self.jobs, self.rss, self.ready = 0, 0, False
+        self._frames = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        try:
+            while True:
+                frame = _read_frame(self.p.stdout)
+                if frame is None:
+                    break
+                self._frames.put(frame)
+        finally:
+            self._frames.put(None)
+
+    def send(self, obj):
+        _write_frame(self.p.stdin, obj)
+
+    def receive(self, timeout=None):
+        # Returns the next frame, or None if the worker has exited; raises queue.Empty on timeout
+        frame = self._frames.get(timeout=timeout)
+        if frame is None:
+            self._frames.put(None)
+        elif 'rss' in frame:
+            self.rss = frame['rss']
+        return frame
+
+    def kill(self):
+        self.p.kill()
+        self.p.wait()
+        self.p.stdin.close()
+        self.p.stdout.close()
+
+    def close(self, timeout=5):
+        # Closing stdin tells the worker to exit
+        try:
+            self.p.stdin.close()
+            self.p.wait(timeout)
+        except (OSError, sp.TimeoutExpired):
+            self.p.kill()
+            self.p.wait()
+        self.p.stdout.close()
+
+
+class WorkerPool(object):
+    '''Pool of up to `size` (default: one per CPU) long-lived worker processes, each with its own warm JVM, for
+       decoding one image (or a few) at a time without starting a new JVM for each. With `prewarm=True`, all the
+       workers are started immediately, and replacements are started as soon as a worker is retired; otherwise, they
+       are started when first needed. A worker is replaced after `max_jobs` jobs, or once its resident set size
+       exceeds `max_rss` bytes. The workers use the classpath, java binary and JVM options of `reader`, and the JPype
+       backend, so JPype must be installed.'''
+
+    def __init__(self, reader=None, size=None, max_jobs=1000, max_rss=None, prewarm=True, startup_timeout=60):
+        self.reader = reader if reader is not None else BarCodeReader()
+        self.size = size or os.cpu_count() or 1
+        self.max_jobs, self.max_rss, self.prewarm, self.startup_timeout = max_jobs, max_rss, prewarm, startup_timeout
+        self.cmd = [sys.executable, '-m', 'zxing.worker', '--classpath', self.reader.classpath, '--java', self.reader.java]
+        if self.reader.zxing_version:
+            self.cmd += ['--zxing-version', self.reader.zxing_version]
+        for option in self.reader.jvm_options:
+            self.cmd.append('--jvm-option=' + option)
+        self.recycled = self.killed = 0
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._next_id = 0
+        self._closed = False
+        if prewarm:
+            # Wait for them all to be ready, so that the first requests don't pay for JVM startup
+            workers = [self._start() for ii in range(self.size)]
+            try:
+                for w in workers:
+                    self._wait_ready(w)
+            except BaseException:
+                for w in workers:
+                    if w in self._workers:
+                        self._retire(w, kill=True, replace=False)
+                raise
+            for w in workers:
+                self._idle.put(w)
+
+    def _start(self):
+        w = _Worker(self.cmd)
+        with self._lock:
+            self._workers.add(w)
+        return w
+
+    def _wait_ready(self, w):
+        if not w.ready:
+            try:
+                frame = w.receive(self.startup_timeout)
+            except queue.Empty:
+                frame = None
+            if not frame or not frame.get('ready'):
+                self._retire(w, kill=True, replace=False)
+                if frame and 'error' in frame:
+                    raise BarCodeReaderException(frame['error']['message'], frame['error']['filename'])
+                raise BarCodeReaderException("Worker process failed to start", self.cmd[0])
+            w.ready = True
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            start = len(self._workers) < self.size
+        return self._start() if start else self._idle.get()
+
+    def _retire(self, w, kill=False, replace=None):
+        with self._lock:
+            self._workers.discard(w)
+        if kill:
+            self.killed += 1
+            w.kill()
+        else:
+            self.recycled += 1
+            w.close()
+        if (self.prewarm if replace is None else replace) and not self._closed:
+            self._idle.put(self._start())
+
+    def decode(self, filenames, timeout=None, try_harder=False, possible_formats=None, pure_barcode=False,
+               products_only=False, errors='raise'):
+        '''Like BarCodeReader.decode(), but the images are decoded by one of the pool's workers. If it takes more than
+           `timeout` seconds, the worker is killed (and replaced), and BarCodeReaderException is raised.'''
+        if self._closed:
+            raise RuntimeError("WorkerPool is closed")
+        if errors not in ('raise', 'return'):
+            raise ValueError("errors must be 'raise' or 'return'")
+        with DecodeStats(self.reader, 'pool') as stats:
+            stats.backend = 'pool'
+            possible_formats = (possible_formats,) if isinstance(possible_formats, str) else possible_formats
+            one_file, file_uris, temp_files = self.reader._prepare(filenames, stats)
+            try:
+                with self._lock:
+                    self._next_id += 1
+                    job_id = self._next_id
+                options = dict(try_harder=try_harder, possible_formats=possible_formats, pure_barcode=pure_barcode,
+                               products_only=products_only)
+                reply = self._run(dict(id=job_id, uris=file_uris, options=options, errors=errors), timeout, stats)
+            finally:
+                for tf in temp_files:
+                    tf.close()
+
+            if 'error' in reply:
+                raise BarCodeReaderException(reply['error']['message'], reply['error']['filename'])
+            codes = []
+            for uri, d in zip(file_uris, reply['results']):
+                if 'error' in d:
+                    codes.append(BarCodeReaderException(d['error']['message'], d['error']['filename']))
+                else:
+                    # Results are in the same order as the URIs
+                    codes.append(BarCode.from_dict(dict(d, uri=uri)))
+            stats.barcodes = sum(1 for c in codes if c and not isinstance(c, BarCodeReaderException))
+            return codes[0] if one_file else codes
+
+    def _run(self, job, timeout, stats):
+        w = self._checkout()
+        try:
+            self._wait_ready(w)
+        except BaseException:
+            if self.prewarm and not self._closed:
+                self._idle.put(self._start())
+            raise
+        t0 = perf_counter()
+        try:
+            w.send(job)
+            reply = w.receive(timeout)
+        except queue.Empty:
+            self._retire(w, kill=True)
+            fn = file_uri_to_path(job['uris'][0]) if len(job['uris']) == 1 else None
+            raise BarCodeReaderException("Worker process timed out after %g seconds" % timeout, fn) from TimeoutError()
+        except BaseException:
+            self._retire(w, kill=True)
+            raise
+        stats.add(java_time=perf_counter() - t0)
+        if reply is None:
+            self._retire(w, kill=True)
+            raise BarCodeReaderException("Worker process exited unexpectedly", self.cmd[0])
+
+        w.jobs += 1
+        if w.jobs >= self.max_jobs or (self.max_rss and w.rss > self.max_rss):
+            self._retire(w)
+        else:
+            self._idle.put(w)
+        return reply
+
+    def close(self):
+        '''Stops all the workers, waiting for those which are busy to finish their jobs.'''
+        self._closed = True
+        while True:
+            with self._lock:
+                if not self._workers:
+                    break
+            w = self._idle.get()
+            with self._lock:
+                self._workers.discard(w)
+            w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())